@@ -7,7 +7,13 @@ To give some answers to the most interesting parts of the emulation:
 
 > The `Process.__new_random_threads__` method generates a random number of threads with random burst times.
 > Every one in a thousand times, a thread will have a burst time that is exponentially larger than the rest.
+> `EventSimulation` makes the same scheduling decisions as the emulation on a virtual clock, without threads,
+> to run millions of processes instead of hundreds.
+> The scheduling policy is pluggable (`BaseSchedular`): FCFS, SRTF, round-robin and MLFQ come with the aged SJF `Schedular`,
+> and `compare_policies` runs them all on the same workload.
 '''
+import copy
+import heapq
 import threading
 import time
 import random
@@ -116,13 +122,14 @@ class Process():
     - generates `random.randint(1, self.max_threads)` number of threads
     - generates random burst times using `NumberGenerator.random_bt` method for each of the threads
     - decides which (if any) thread should be longer then usual (see bellow)
-    - fills the `self.threads` list with threads, each having the same function assigned to it that simply sleeps for the amount of time given by the number generator 
+    - keeps the burst times in `self.burst_times`, from which `self.threads` is filled on first use with threads, each having the same function assigned to it that simply sleeps for the amount of time given by the number generator 
     
     The change a thread within any process will be longer then others is calculated via `random.randint(1, self.max_long_thread_change)`.
     If the outcome of this is 1, then a single random thread is selected and its burst time is is multiplied by `self.long_thread_bt_multiplier`
     """
     def __init__(self, n_threads: int = 2, max_long_thread_change: int = 10, long_thread_bt_multiplier: int = 10) -> None:
-        self.threads: list[threading.Thread] = []
+        self.burst_times: list[float] = []
+        self.__threads__: list[threading.Thread] | None = None
         self.state: ProcessState = ProcessState.NEW
         self.id: int = NumberGenerator().new_process_id()
         self.bt_sum: int = 0
@@ -130,6 +137,10 @@ class Process():
         self.min_bt: int = 0
         self.max_bt: int = 0
         self.ttc: int = 0
+        self.wt: int = 0     # time spent waiting in the ready queue before running
+        self.remaining_bt: float = 0    # time left to run, the longest burst time until the process first runs
+        self.context_switches: int = 0  # number of times a core switched to this process
+        self.cs_time: float = 0         # time spent on those context switches
 
         # Gaurd clauses for thread generation parameters
         if not isinstance(n_threads, int):
@@ -154,7 +165,7 @@ class Process():
         """
         global _verbose  # Because the encapsulation of `thread_task` function, we need to access this variable from the global scope, and then again in the `thread_task` function
 
-        self.threads = []  # Empty the list
+        self.__threads__ = None  # Empty the list
 
         ng = NumberGenerator()
         burst_times = [
@@ -173,20 +184,40 @@ class Process():
             if _verbose:
                 print(f"Thread {chosen_bt} in process {self.id} has been chosen to have a burst time {long_thread_bt_multiplier} times larger")
 
-        # Create the threads
-        tg = ThreadGenerator()
-        for bt in burst_times:
-            self.threads.append(tg.generate_thread(bt))
+        # The threads are created from these on first use, see `threads`
+        self.burst_times = burst_times
 
         # At this point we can set the `bt_sum` and `avg_bt` properties
         self.bt_sum = sum(burst_times)
-        self.avg_bt = self.bt_sum / len(self.threads)
+        self.avg_bt = self.bt_sum / len(burst_times)
         self.min_bt = min(burst_times)
         self.max_bt = max(burst_times)
+        self.remaining_bt = self.max_bt
 
-    def execute(self):
+    @property
+    def threads(self) -> list[threading.Thread]:
+        """
+        The threads of the process, one per burst time. Generated on first use, as only an emulated run needs them.
+        """
+        if self.__threads__ is None:
+            tg = ThreadGenerator()
+            self.__threads__ = [tg.generate_thread(bt) for bt in self.burst_times]
+        return self.__threads__
+
+    def next_burst(self, time_slice: float | None = None) -> float:
+        """
+        Returns how long the process runs for when it is given `time_slice` (`None` to run until it is done).
+        """
+        if time_slice is None:
+            return self.remaining_bt
+        return min(time_slice, self.remaining_bt)
+
+    def execute(self, time_slice: float | None = None):
         """
         Executes the process by running all the threads and waiting for them to finish.
+
+        With `time_slice`, the threads run for at most that long (a partial burst) and the process is left ready,
+        with the time it has left in `remaining_bt`. The threads run concurrently, so they all get the same slice.
         """
         global _verbose
 
@@ -195,10 +226,26 @@ class Process():
         if _verbose:
             print(f"Process {self.id} is running")
 
-        for thread in self.threads:
+        run = self.next_burst(time_slice)
+        if run == self.max_bt:
+            threads = self.threads
+        else:
+            # Threads for the part of the burst times that is left, up to the slice
+            done = self.max_bt - self.remaining_bt
+            tg = ThreadGenerator()
+            threads = [tg.generate_thread(min(bt - done, run)) for bt in self.burst_times if bt > done]
+
+        for thread in threads:
             thread.start()
-        for thread in self.threads:
+        for thread in threads:
             thread.join()
+        self.remaining_bt -= run
+
+        if self.remaining_bt > 0:
+            self.state = ProcessState.READY
+            if _verbose:
+                print(f"Process {self.id} has been preempted")
+            return
 
         # After all threads have finished execution, update state to terminated
         self.state = "terminated"
@@ -207,15 +254,44 @@ class Process():
 
 
 class QueueItem():
+    """
+    A process in a queue.
+
+    The age of an item is the number of items popped from its queue since it was added, and is kept as
+    the enqueue epoch: `age = <pops of the queue> - epoch`. Out of a queue, the age stays as it was.
+    """
     def __init__(self, process: Process) -> None:
         self.process = process
-        self.age = 0
+        self.epoch = 0
         self.arrival_time = 0
+        self.level = 0      # queue level for `MLFQSchedular`, 0 being the highest priority
+        self.__queue__: 'BaseQueue | None' = None  # the queue the item is in, if any
+
+    @property
+    def age(self) -> int:
+        pops = 0 if self.__queue__ is None else self.__queue__.__pops__
+        return pops - self.epoch
+
+    @age.setter
+    def age(self, value: int):
+        pops = 0 if self.__queue__ is None else self.__queue__.__pops__
+        self.epoch = pops - value
 
 
 class BaseQueue():
-    def __init__(self) -> None:
+    def __init__(self, clock: Callable[[], float] | None = None) -> None:
         self.__queue__: list[QueueItem] = []
+        self.__pops__ = 0   # number of items popped so far, the clock of the ages (see `QueueItem`)
+        self.clock = clock  # returns the time for `arrival_time`, see `now`
+
+    def now(self) -> float:
+        """
+        Returns the time of the queue's clock, by default the number of seconds since the simulation started.
+        """
+        global _time_delta
+        if self.clock is not None:
+            return self.clock()
+        return time.time() - _time_delta
 
     def is_empty(self) -> bool:
         """
@@ -227,8 +303,8 @@ class BaseQueue():
         """
         Adds a process to the ready queue.
         """
-        global _time_delta
-        item.arrival_time = time.time() - _time_delta
+        item.arrival_time = self.now()
+        self.__enqueue__(item)
         self.__queue__.append(item)
 
     def pop(self, i: int = 0) -> (QueueItem | None):
@@ -242,11 +318,26 @@ class BaseQueue():
         except IndexError:
             return None
 
-        for i in range(len(self.__queue__)):
-            self.__queue__[i].age += 1
-
+        self.__dequeue__(q)
         return q
 
+    def __enqueue__(self, item: QueueItem):
+        """
+        Starts aging `item` with this queue, from the age it has.
+        """
+        age = item.age
+        item.__queue__ = self
+        item.age = age
+
+    def __dequeue__(self, item: QueueItem):
+        """
+        Stops aging `item` and ages the processes left in the queue by one, in O(1).
+        """
+        age = item.age
+        item.__queue__ = None
+        item.age = age
+        self.__pops__ += 1
+
     def __iter__(self):
         """
         Get an iterator from an object.
@@ -267,35 +358,261 @@ class BaseQueue():
 class ReadyQueue(BaseQueue):
     """
     Holds processes internally for schedular to pick from.
+
+    The items are indexed by name, each index being a heap of `(key(item), seq, item)`:
+    - `"burst_time"`, for the shortest process: `avg_bt`
+    - `"age"`, for the oldest process: `(epoch, -bt_sum)`, the lowest enqueue epoch being
+      the highest age (see `QueueItem`)
+    - any index a schedular adds with `index`, e.g. the remaining burst time for SRTF
+
+    `seq` numbers the items in order of arrival and breaks ties, so the first one to arrive goes first.
+    An item taken through one heap stays behind in the others until it gets to the top (lazy deletion),
+    so both `first` and `pop_first` are O(log n) (amortized).
+
+    `shortest` and `oldest` break ties as the list this queue used to be, which was sorted (stably) on every
+    selection: among items that were in the queue at a selection of the other kind, a tie goes the way that
+    selection ordered them (equally short: the oldest, longest one; equally old and long: the shortest one),
+    otherwise to the first one to arrive.
     """
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, clock: Callable[[], float] | None = None) -> None:
+        super().__init__(clock)
+        self.__queue__: dict[int, QueueItem] = {}   # seq -> item, in queue order
+        self.__indexes__: dict[str, tuple[Callable, list[tuple]]] = {}
+        self.__seq__ = 0
+        # the last `seq` in the queue at a selection by burst time and by age, see `shortest` and `oldest`
+        self.__selected__ = {"burst_time": 0, "age": 0}
+        self.index("burst_time", lambda item: item.process.avg_bt)
+        self.index("age", lambda item: (item.epoch, -item.process.bt_sum))
+
+    def index(self, name: str, key: Callable[[QueueItem], object]):
+        """
+        Indexes the processes by `key`, which is taken when a process is added. Does nothing if the index exists.
+        """
+        if name in self.__indexes__:
+            return
+        heap = [(key(item), seq, item) for seq, item in self.__queue__.items()]
+        heapq.heapify(heap)
+        self.__indexes__[name] = (key, heap)
+
+    def add(self, item: QueueItem):
+        """
+        Adds a process to the ready queue.
+        """
+        item.arrival_time = self.now()
+        self.__enqueue__(item)
+        self.__seq__ += 1
+        self.__queue__[self.__seq__] = item
+        for key, heap in self.__indexes__.values():
+            heapq.heappush(heap, (key(item), self.__seq__, item))
+
+    def __remove__(self, seq: int) -> QueueItem:
+        """
+        Removes the item with sequence number `seq` and updates the age of the processes left in the queue.
+        """
+        q = self.__queue__.pop(seq)
+        self.__dequeue__(q)
+
+        # Drop the entries of removed items once they make up most of a heap
+        for _, heap in self.__indexes__.values():
+            if len(heap) > 2 * len(self.__queue__) + 16:
+                heap[:] = [entry for entry in heap if entry[1] in self.__queue__]
+                heapq.heapify(heap)
+        return q
+
+    def __top__(self, heap: list) -> (tuple | None):
+        """
+        Returns the first entry of `heap` that is still in the queue, `None` if the queue is empty.
+        """
+        while heap and heap[0][1] not in self.__queue__:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def first(self, name: str) -> (QueueItem | None):
+        """
+        Returns the process with the lowest key in index `name` without removing it, `None` if the queue is empty.
+        """
+        entry = self.__top__(self.__indexes__[name][1])
+        return None if entry is None else entry[-1]
+
+    def pop_first(self, name: str) -> (QueueItem | None):
+        """
+        Removes and returns the process with the lowest key in index `name`, `None` if the queue is empty.
+        """
+        heap = self.__indexes__[name][1]
+        entry = self.__top__(heap)
+        return None if entry is None else self.__remove__(heapq.heappop(heap)[1])
+
+    def __tie_index__(self, name: str) -> str:
+        """
+        Returns the index to select by `name` from: `name` itself, or the one that also orders its ties the way
+        the last selection of the other kind did, if the first item in `name` was in the queue then.
+        The items tied with it arrived between the same two pops (or, by burst time, earlier), so they were too.
+        """
+        entry = self.__top__(self.__indexes__[name][1])
+        other = "age" if name == "burst_time" else "burst_time"
+        if entry is None or entry[1] > self.__selected__[other]:
+            return name
+        if name == "burst_time":
+            self.index("burst_time_age", lambda item: (item.process.avg_bt, item.epoch, -item.process.bt_sum))
+            return "burst_time_age"
+        self.index("age_burst_time", lambda item: (item.epoch, -item.process.bt_sum, item.process.avg_bt))
+        return "age_burst_time"
+
+    def shortest(self) -> (QueueItem | None):
+        """
+        Returns the process with the lowest average burst time without removing it, `None` if the queue is empty.
+        """
+        return self.first(self.__tie_index__("burst_time"))
+
+    def oldest(self) -> (QueueItem | None):
+        """
+        Returns the oldest process (the longest one among equally old ones) without removing it,
+        `None` if the queue is empty.
+        """
+        return self.first(self.__tie_index__("age"))
+
+    def pop_shortest(self) -> (QueueItem | None):
+        """
+        Removes and returns the process with the lowest average burst time, `None` if the queue is empty.
+        """
+        name = self.__tie_index__("burst_time")
+        self.__selected__["burst_time"] = self.__seq__
+        return self.pop_first(name)
+
+    def pop_oldest(self) -> (QueueItem | None):
+        """
+        Removes and returns the oldest process, `None` if the queue is empty.
+        """
+        name = self.__tie_index__("age")
+        self.__selected__["age"] = self.__seq__
+        return self.pop_first(name)
+
+    def pop(self, i: int = 0) -> (QueueItem | None):
+        """
+        Removes and returns the process at index `i` from the ready queue. If the index is out of range, returns `None`.
+
+        Updates the age of the processes left in the queue, if any.
+        """
+        try:
+            seq = list(self.__queue__)[i]
+        except IndexError:
+            return None
+        return self.__remove__(seq)
 
-    def get_first_n(self, n: int):
+    def __iter__(self):
         """
-        Returns the first `n` processes from the ready queue.
+        Get an iterator from an object.
         """
-        return self.__queue__[:n]
+        return iter(self.__queue__.values())
+
+    def __getitem__(self, index):
+        """
+        Get an item from the queue by index.
+        """
+        return list(self.__queue__.values())[index]
+
+    def get_first_n(self, n: int, sorting_style: str = "burst_time"):
+        """
+        Returns the first `n` processes the schedular would pick from the ready queue,
+        by burst time, by age (see `Schedular.sorting_style`) or by another index.
+        """
+        heap = self.__indexes__[sorting_style][1]
+        entries = heapq.nsmallest(n, (entry for entry in heap if entry[1] in self.__queue__))
+        return [entry[-1] for entry in entries]
 
     def sort(self, key=None, reverse: bool = False):
         """
-        Sorts the queue in place.
+        Sorts the queue in place. This changes the order of iteration, indexing and `pop`,
+        not the order the schedular picks processes in.
         """
-        self.__queue__.sort(key=key, reverse=reverse)
+        items = sorted(self.__queue__.items(), key=lambda x: key(x[1]) if key else x[0], reverse=reverse)
+        self.__queue__ = dict(items)
 
 
 class CompletedQueue(BaseQueue):
     """
     Holds processes that have completed execution.
     """
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, clock: Callable[[], float] | None = None) -> None:
+        super().__init__(clock)
 
     def get_last_n(self, n: int):
         return self.__queue__[-n:]
 
+    def stats(self) -> dict:
+        """
+        Turnaround metrics of the completed processes, in seconds. The turnaround time of a process is the time
+        it waited in the ready queue (`wt`) plus the time it took to complete (`ttc`); `arrival_time` in this queue
+        is the time it completed. Time spent on context switches (`cs_time`) counts towards the turnaround time too.
+
+        ## Returns
+        - dict: `processes`, `mean_wt`, `max_wt`, `mean_ttc`, `mean_tat`, `p99_tat` and `max_tat`,
+          `makespan` (the time the last process completed), `throughput` (processes per second)
+          and `context_switches`
+        """
+        n = len(self.__queue__)
+        if n == 0:
+            return {"processes": 0}
+        wts = [item.process.wt for item in self.__queue__]
+        tats = sorted(item.process.wt + item.process.ttc + item.process.cs_time for item in self.__queue__)
+        makespan = max(item.arrival_time for item in self.__queue__)
+        return {
+            "processes": n,
+            "mean_wt": sum(wts) / n,
+            "max_wt": max(wts),
+            "mean_ttc": sum(item.process.ttc for item in self.__queue__) / n,
+            "mean_tat": sum(tats) / n,
+            "p99_tat": tats[min(n - 1, int(n * 0.99))],
+            "max_tat": tats[-1],
+            "makespan": makespan,
+            "throughput": n / makespan if makespan > 0 else 0.0,
+            "context_switches": sum(item.process.context_switches for item in self.__queue__),
+        }
+
+
+class BaseSchedular():
+    """
+    A scheduling policy, as taken by `Dispatcher`, `Simulation` and `EventSimulation`:
+    - `select_process` selects the process to run next from a ready queue
+    - `time_slice` is how long the process may run before it goes back to the ready queue, `None` to run until done
+    - `preempts` tells whether a process arriving in the ready queue takes the core from the running one
+    - `preempted` is called when a process goes back to the ready queue before it is done
+
+    A schedular that needs its own order of the ready queue adds an index to it (see `ReadyQueue.index`).
+    """
+    def select_process(self, queue: ReadyQueue) -> QueueItem | None:
+        """
+        Selects a process to execute.
+
+        ## Returns
+        - QueueItem: None if the queue is empty, otherwise the selected process.
+        """
+        raise NotImplementedError
+
+    def time_slice(self, item: QueueItem) -> float | None:
+        """
+        Returns how long the selected process may run for, `None` to run until it is done (non-preemptive).
+        """
+        return None
+
+    def preempts(self, running: QueueItem, remaining_bt: float, item: QueueItem) -> bool:
+        """
+        Returns `True` if `item`, arriving in the ready queue, should preempt the `running` process,
+        which has `remaining_bt` left to run.
+        """
+        return False
+
+    def preempted(self, item: QueueItem):
+        """
+        Called when the process goes back to the ready queue before it is done.
+        """
+        pass
+
+    def __str__(self) -> str:
+        return type(self).__name__
+
 
-class Schedular():
+class Schedular(BaseSchedular):
     """
     Selects a process to execute based on non-preemtive SJF algorithm + process age.
     """
@@ -306,6 +623,9 @@ class Schedular():
         self.age_threshold = age_threshold
         self.sorting_style = "burst_time"
 
+    def __str__(self) -> str:
+        return f"aged SJF (age threshold {self.age_threshold})"
+
     def select_process(self, queue: ReadyQueue) -> QueueItem | None:
         """
         Selects a process to execute based on non-preemtive SJF algorithm + process age.  
@@ -321,83 +641,250 @@ class Schedular():
             return None
 
         # is their any queue item with an age above the specified threshold?
-        if any([item.age >= self.age_threshold for item in queue]):
+        if queue.oldest().age >= self.age_threshold:
             if _verbose:
-                print("Sorting the ready queue by age")
+                print("Selecting the oldest process in the ready queue")
 
             self.sorting_style = "age"
-            # Sort the ready queue: first by age (descending), then by burst time (descending)
-            queue.sort(key=lambda x: (-x.age, -x.process.bt_sum))
+            # the oldest process, the longest one among equally old ones
+            return queue.pop_oldest()
 
-        else:
-            if _verbose:
-                print("Sorting the ready queue by burst time")
-            
-            self.sorting_style = "burst_time"
-            # sort the ready queue by process burst time from low to high
-            queue.sort(key=lambda x: x.process.avg_bt)
+        if _verbose:
+            print("Selecting the shortest process in the ready queue")
+
+        self.sorting_style = "burst_time"
+        # the process with the lowest average burst time
+        return queue.pop_shortest()
+
+
+class FCFSSchedular(BaseSchedular):
+    """
+    Selects processes in order of arrival in the ready queue (first come, first served), non-preemptive.
+    """
+    def select_process(self, queue: ReadyQueue) -> QueueItem | None:
+        queue.index("arrival", lambda item: 0)
+        return queue.pop_first("arrival")
+
+    def __str__(self) -> str:
+        return "FCFS"
+
+
+class SRTFSchedular(BaseSchedular):
+    """
+    Selects the process with the shortest remaining burst time (shortest remaining time first).
+    A process arriving with a shorter one preempts the running process.
+    """
+    def select_process(self, queue: ReadyQueue) -> QueueItem | None:
+        queue.index("remaining_bt", lambda item: item.process.remaining_bt)
+        return queue.pop_first("remaining_bt")
+
+    def preempts(self, running: QueueItem, remaining_bt: float, item: QueueItem) -> bool:
+        return item.process.remaining_bt < remaining_bt
+
+    def __str__(self) -> str:
+        return "SRTF"
+
+
+class RoundRobinSchedular(BaseSchedular):
+    """
+    Selects processes in order of arrival in the ready queue, each for at most `quantum` seconds,
+    after which it goes to the back of the queue (round-robin).
+    """
+    def __init__(self, quantum: float = 1.0) -> None:
+        if not isinstance(quantum, (int, float)) or quantum <= 0:
+            quantum = 1.0
+        self.quantum = quantum
+
+    def select_process(self, queue: ReadyQueue) -> QueueItem | None:
+        queue.index("arrival", lambda item: 0)
+        return queue.pop_first("arrival")
+
+    def time_slice(self, item: QueueItem) -> float | None:
+        return self.quantum
+
+    def __str__(self) -> str:
+        return f"RR (quantum {self.quantum})"
+
+
+class MLFQSchedular(BaseSchedular):
+    """
+    Multi-level feedback queue: selects processes from the highest level first (`QueueItem.level`, 0 being the highest),
+    in order of arrival within a level. A process at level `i` may run for `quanta[i]` seconds (`None` until done);
+    one that uses up its slice moves a level down. A new process waits for the running slice to end.
+    """
+    def __init__(self, quanta: tuple = (1.0, 2.0, 4.0)) -> None:
+        if not isinstance(quanta, (tuple, list)) or len(quanta) == 0:
+            quanta = (1.0, 2.0, 4.0)
+        self.quanta = tuple(quanta)
+
+    def select_process(self, queue: ReadyQueue) -> QueueItem | None:
+        queue.index("level", lambda item: item.level)
+        return queue.pop_first("level")
+
+    def time_slice(self, item: QueueItem) -> float | None:
+        return self.quanta[item.level]
+
+    def preempted(self, item: QueueItem):
+        item.level = min(item.level + 1, len(self.quanta) - 1)
 
-        # return the first item in the ready queue
-        return queue.pop()
+    def __str__(self) -> str:
+        return f"MLFQ (quanta {', '.join(str(q) for q in self.quanta)})"
 
 
 class CPU():
     """
-    Emulates the CPU.
+    Emulates a core of the CPU.
     """
-    def __init__(self) -> None:
+    def __init__(self, core: int = 0) -> None:
+        self.core = core
         self.running_process: Process | None = None
+        self.last_process: Process | None = None    # the process whose context the core has
+        self.busy_time: float = 0.0     # time spent running processes
 
-    def run(self, process: Process):
+    def context_switch(self, process: Process, cost: float) -> float:
+        """
+        Switches the core to the context of `process`, and returns the time it takes: `cost`,
+        or 0 if the core ran that process last.
+        """
+        if self.last_process is process:
+            return 0.0
+        self.last_process = process
+        process.context_switches += 1
+        process.cs_time += cost
+        return cost
+
+    def run(self, process: Process, time_slice: float | None = None):
         """
-        Runs the CPU until the ready queue is empty.
+        Runs the process on this core until it has finished, or for at most `time_slice`.
 
         ## Parameters
         - process: Process instance
+        - time_slice: see `Process.execute`
         """
         global _verbose
         
         self.running_process = process
         if _verbose:
-            print(f"Process {process.id} is running")
+            print(f"Process {process.id} is running on core {self.core}")
 
-        process.execute()
+        start = time.time()
+        process.execute(time_slice)
+        self.busy_time += time.time() - start
         self.running_process = None
 
 
 class Dispatcher():
     """
-    Gives control of the CPU’s core to the process selected by the Scheduler.
+    Gives control of the CPU’s cores to the processes selected by the Scheduler.
+
+    Each core has a ready queue of its own, picked from with the same schedular. A core whose ready queue is empty
+    steals the process the scheduler would pick next from the longest queue of the other cores (work stealing).
+    New processes go to the core with the least work: the shortest ready queue, an idle core first.
+
+    Switching a core to another process takes `context_switch_cost` seconds.
     """
-    def __init__(self) -> None:
-        self.CPU = CPU()
+    def __init__(self, n_cores: int = 1, context_switch_cost: float = 0.0) -> None:
+        if not isinstance(n_cores, int) or n_cores < 1:
+            n_cores = 1
+        if not isinstance(context_switch_cost, (int, float)) or context_switch_cost < 0:
+            context_switch_cost = 0.0
+        self.CPUs = [CPU(core) for core in range(n_cores)]
+        self.context_switch_cost = context_switch_cost
+        self.steals: int = 0            # Number of processes stolen by idle cores
+        self.lock = threading.Lock()    # Guards the queues while cores dispatch concurrently
+
+    @property
+    def CPU(self):
+        """
+        The first core, the only one of a single core CPU.
+        """
+        return self.CPUs[0]
 
-    def dispatch(self, scheduler: Schedular, ready_queue: ReadyQueue, completed_queue: CompletedQueue):
+    def place(self, ready_queues: list[ReadyQueue]) -> int:
+        """
+        Returns the core whose ready queue a new process should be added to.
+        """
+        return min(
+            range(len(ready_queues)),
+            key=lambda core: (len(ready_queues[core]) + (self.CPUs[core].running_process is not None), core)
+        )
+
+    def select(self, scheduler: BaseSchedular, ready_queue: ReadyQueue, steal_from: list[ReadyQueue] | None = None) -> QueueItem | None:
+        """
+        Selects a process from `ready_queue`, or steals one from the longest queue in `steal_from` if it is empty.
+
+        ## Returns
+        - QueueItem: None if there is no process to run
+        """
+        global _verbose
+
+        queue_item = scheduler.select_process(ready_queue)
+        if queue_item is None and steal_from:
+            victim = max(steal_from, key=len)
+            queue_item = scheduler.select_process(victim)
+            if queue_item is not None:
+                self.steals += 1
+                if _verbose:
+                    print(f"Process {queue_item.process.id} has been stolen from another core")
+        return queue_item
+
+    def dispatch(self,
+                 scheduler: BaseSchedular,
+                 ready_queue: ReadyQueue,
+                 completed_queue: CompletedQueue,
+                 core: int = 0,
+                 steal_from: list[ReadyQueue] | None = None,
+        ) -> QueueItem | None:
         """
-        Selects a process from `ready_queue`, executes it and moves it to `completed_queue`.
+        Selects a process from `ready_queue` (see `select`), executes it on core `core` and moves it to `completed_queue`.
         Also sets the time it took to complete the process.
+        If the scheduler gives the process a time slice it doesn't finish in, the process goes back to `ready_queue` instead.
 
         ## Parameters
-        - scheduler: Schedular instance
-        - ready_queue: ReadyQueue instance
+        - scheduler: BaseSchedular instance, the scheduling policy
+        - ready_queue: ReadyQueue instance of the core
         - completed_queue: CompletedQueue instance
+        - core: the core to run the process on
+        - steal_from: ReadyQueue instances of the other cores
+
+        ## Returns
+        - QueueItem: the process that ran, None if there was none to run
         """
         global _verbose
 
-        queue_item = scheduler.select_process(ready_queue)
+        with self.lock:
+            queue_item = self.select(scheduler, ready_queue, steal_from)
         if queue_item != None:
             if _verbose:
                 print(f"Process {queue_item.process.id} has been selected to run")
 
-            queue_item.process.state = ProcessState.RUNNING
+            process = queue_item.process
+            process.state = ProcessState.RUNNING
+            process.wt += ready_queue.now() - queue_item.arrival_time
+
+            cost = self.CPUs[core].context_switch(process, self.context_switch_cost)
+            if cost > 0:
+                time.sleep(cost)
 
             # Execute the process and measure the time it took to complete
             start = time.time()
-            self.CPU.run(queue_item.process)
+            self.CPUs[core].run(process, scheduler.time_slice(queue_item))
             end = time.time()
-            queue_item.process.ttc = end - start
+            process.ttc += end - start
 
-            completed_queue.add(queue_item)
+            with self.lock:
+                if process.remaining_bt > 0:
+                    scheduler.preempted(queue_item)
+                    ready_queue.add(queue_item)
+                else:
+                    completed_queue.add(queue_item)
+        return queue_item
+
+    def utilization(self, elapsed: float) -> list[float]:
+        """
+        Returns the fraction of `elapsed` each core has spent running processes.
+        """
+        return [cpu.busy_time / elapsed if elapsed > 0 else 0.0 for cpu in self.CPUs]
 
 
 class QueueItemGenerator():
@@ -433,18 +920,23 @@ class Simulation():
     """
     Runs a thread safe simulation of the SJF algorithm.
 
-    It does this by running two threads concurrently:
-    - One thread generates new processes and adds them to the ready queue on a regular interval
-    - The other thread selects a process from the ready queue, executes it and moves it to the completed queue
+    It does this by running threads concurrently:
+    - One thread generates new processes and adds them to the ready queues on a regular interval
+    - One thread per core selects a process from the ready queue of the core (or steals one, see `Dispatcher`),
+      executes it and moves it to the completed queue
+
+    The scheduler is the SJF with aging `Schedular` unless another policy is given. Running processes are real threads,
+    so a process is only taken off a core when its time slice ends: `BaseSchedular.preempts` is not asked here,
+    see `EventSimulation` for preemption on arrival.
     """
-    def __init__(self) -> None:
+    def __init__(self, n_cores: int = 1, scheduler: BaseSchedular | None = None, context_switch_cost: float = 0.0) -> None:
         self.queue_item_generator = QueueItemGenerator()
-        self.scheduler = Schedular()
-        self.ready_queue = ReadyQueue()
-        self.dispatcher = Dispatcher()
+        self.scheduler = scheduler if scheduler is not None else Schedular()
+        self.dispatcher = Dispatcher(n_cores, context_switch_cost)
+        self.ready_queues = [ReadyQueue() for _ in self.dispatcher.CPUs]
         self.completed_queue = CompletedQueue()
 
-        self.dispatch_thread: threading.Thread | None = None
+        self.dispatch_threads: list[threading.Thread] = []
         self.generate_thread: threading.Thread | None = None
         
         self.N_items_to_keep_ready: int = 10
@@ -455,6 +947,26 @@ class Simulation():
         self._generate_sema = threading.Semaphore(1)
         self.is_running = False
 
+    @property
+    def ready_queue(self) -> ReadyQueue:
+        """
+        The ready queue of the first core, the only one of a single core CPU.
+        """
+        return self.ready_queues[0]
+
+    def n_ready(self) -> int:
+        """
+        Returns the number of processes in the ready queues of all cores.
+        """
+        return sum(len(queue) for queue in self.ready_queues)
+
+    def add(self, item: QueueItem):
+        """
+        Adds a process to the ready queue of the core with the least work.
+        """
+        with self.dispatcher.lock:
+            self.ready_queues[self.dispatcher.place(self.ready_queues)].add(item)
+
     def setup(self, 
               N_start_processes: int = 0, 
               N_items_to_keep_ready: int = 10,
@@ -474,42 +986,44 @@ class Simulation():
         self.generate_callback = generate_callback
 
         # Reinitialize the queues
-        self.ready_queue = ReadyQueue()
+        self.ready_queues = [ReadyQueue() for _ in self.dispatcher.CPUs]
         self.completed_queue = CompletedQueue()
 
-        # Add some processes to the ready queue
+        # Add some processes to the ready queues
         for _ in range(N_start_processes):
-            self.ready_queue.add(self.queue_item_generator.generate_item())
+            self.add(self.queue_item_generator.generate_item())
 
-        # Setup the dispatch thread
-        def __dispatch_thread__():
+        # Setup the dispatch threads, one per core
+        def __dispatch_thread__(core: int):
             while True:
-                # Using rendezvous pattern to ensure the dispatcher and generator don't run at the same time
+                # Using rendezvous pattern to ensure the dispatchers and generator take turns
                 self._dispatch_sema.release()
-                if not self.ready_queue.is_empty() and self.is_running:
+                if self.n_ready() > 0 and self.is_running:
                     if _verbose:
-                        print("Dispatching a process during the simulation")
-                    self.dispatcher.dispatch(self.scheduler, self.ready_queue, self.completed_queue)
+                        print(f"Dispatching a process on core {core} during the simulation")
+                    self.dispatcher.dispatch(self.scheduler, self.ready_queues[core], self.completed_queue, core, self.ready_queues)
                 self._generate_sema.acquire()
 
                 # Run callback if it exists
                 if self.dispatch_callback != None:
                     self.dispatch_callback()
 
-        self.dispatch_thread = threading.Thread(target=__dispatch_thread__)
+        self.dispatch_threads = [
+            threading.Thread(target=__dispatch_thread__, args=(cpu.core,)) for cpu in self.dispatcher.CPUs
+        ]
 
         # Setup the generate queue items thread
         def __generate_queue_items_thread__():
             global _verbose
-            # Generates new processes and adds them to the ready queue
+            # Generates new processes and adds them to the ready queues
             while True:
-                # Using rendezvous pattern to ensure the dispatcher and generator don't run at the same time
+                # Using rendezvous pattern to ensure the dispatchers and generator take turns
                 self._generate_sema.release()
-                if self.is_running and len(self.ready_queue) < N_items_to_keep_ready:
+                if self.is_running and self.n_ready() < N_items_to_keep_ready:
                     if _verbose:
-                        print(f"Adding {N_items_to_keep_ready - len(self.ready_queue)} new processes to the ready queue during the simulation")
-                    for _ in range(N_items_to_keep_ready - len(self.ready_queue)):
-                        self.ready_queue.add(self.queue_item_generator.generate_item())
+                        print(f"Adding {N_items_to_keep_ready - self.n_ready()} new processes to the ready queues during the simulation")
+                    for _ in range(N_items_to_keep_ready - self.n_ready()):
+                        self.add(self.queue_item_generator.generate_item())
                 self._dispatch_sema.acquire()
                 
         self.generate_thread = threading.Thread(target=__generate_queue_items_thread__)
@@ -519,12 +1033,12 @@ class Simulation():
 
     def start(self):
         """
-        Does nothing if `this.init` has not been called, otherwise starts the simulation thread.
+        Does nothing if `this.init` has not been called, otherwise starts the simulation threads.
         """
         global _verbose, _process_counter, _process_counter_mutex, _time_delta
-        if self.generate_thread == None or self.dispatch_thread == None:
+        if self.generate_thread == None or not self.dispatch_threads:
             return
-        if self.generate_thread.is_alive() or self.dispatch_thread.is_alive():
+        if self.generate_thread.is_alive() or any(thread.is_alive() for thread in self.dispatch_threads):
             return
         
         _process_counter_mutex.acquire()
@@ -535,15 +1049,31 @@ class Simulation():
         self._generate_sema.acquire()
 
         _time_delta = time.time()
+        for cpu in self.dispatcher.CPUs:
+            cpu.busy_time = 0.0
+        self.dispatcher.steals = 0
         self.is_running = True
         self.generate_thread.start()
-        self.dispatch_thread.start()
+        for thread in self.dispatch_threads:
+            thread.start()
         if _verbose:
             print("Simulation has started")
 
         self._dispatch_sema.release()
         self._generate_sema.release()
 
+    def stats(self) -> dict:
+        """
+        Returns `CompletedQueue.stats` of the simulation so far, with the `utilization` of the CPU,
+        the `core_utilization` of each core and the number of `steals`.
+        """
+        stats = self.completed_queue.stats()
+        core_utilization = self.dispatcher.utilization(self.completed_queue.now())
+        stats["utilization"] = sum(core_utilization) / len(core_utilization)
+        stats["core_utilization"] = core_utilization
+        stats["steals"] = self.dispatcher.steals
+        return stats
+
     def pause(self):
         """
         Pauses the simulation.
@@ -565,6 +1095,283 @@ class Simulation():
 # endregion
 
 
+# region Discrete-event simulation
+
+class Event:
+    """
+    Enum for the events of `EventSimulation`, in the order they are handled at the same time.
+    """
+    COMPLETION = 0
+    ARRIVAL = 1
+    DISPATCH = 2
+
+
+class EventSimulation():
+    """
+    Runs the SJF emulation as a discrete-event simulation: on a virtual clock, without threads or sleeping.
+
+    Events are kept in a heap of `(time, event, seq, core, item)` and handled in order of time:
+    - `Event.ARRIVAL`: the process is added to the ready queue of the core with the least work,
+      and preempts the process running on that core if the scheduler says so (`BaseSchedular.preempts`)
+    - `Event.DISPATCH`: if the core is idle, the scheduler selects a process from its ready queue to run,
+      or the core steals one (see `Dispatcher`)
+    - `Event.COMPLETION`: the running process is done, or its time slice is: it is moved to the completed queue,
+      or back to the ready queue. The ready queues are then topped up to `N_items_to_keep_ready` processes in all,
+      like `Simulation` does between two dispatches
+
+    A process takes `process.max_bt` to complete, as its threads run concurrently in `Process.execute`,
+    plus `context_switch_cost` each time a core switches to it.
+    The same schedulars, `Dispatcher`, queues and metrics (`wt`, `ttc`, `CompletedQueue.stats`) are used as in
+    the emulation, so the scheduling decisions are the same, only the clock differs: `arrival_time` is in virtual seconds.
+    """
+    def __init__(self, scheduler: BaseSchedular | None = None, n_cores: int = 1, context_switch_cost: float = 0.0) -> None:
+        self.queue_item_generator = QueueItemGenerator()
+        self.scheduler = scheduler if scheduler is not None else Schedular()
+        self.dispatcher = Dispatcher(n_cores, context_switch_cost)
+        self.clock: float = 0.0
+        self.ready_queues = [ReadyQueue(clock=self.now) for _ in self.dispatcher.CPUs]
+        self.completed_queue = CompletedQueue(clock=self.now)
+
+        self.N_items_to_keep_ready: int = 0
+        self.N_processes: int | None = None    # max number of processes to generate, `None` for no limit
+        self.N_generated: int = 0
+
+        self.__events__: list[tuple] = []
+        self.__seq__ = 0
+        self.__dispatching__: set[int] = set()  # cores with a dispatch event pending
+        self.__slices__: dict[int, tuple] = {}  # core -> (seq of its completion event, item, start, context switch, run)
+
+    @property
+    def ready_queue(self) -> ReadyQueue:
+        """
+        The ready queue of the first core, the only one of a single core CPU.
+        """
+        return self.ready_queues[0]
+
+    def n_ready(self) -> int:
+        """
+        Returns the number of processes in the ready queues of all cores.
+        """
+        return sum(len(queue) for queue in self.ready_queues)
+
+    def now(self) -> float:
+        """
+        Returns the time on the virtual clock.
+        """
+        return self.clock
+
+    def setup(self,
+              N_start_processes: int = 0,
+              N_items_to_keep_ready: int = 10,
+              N_processes: int | None = None,
+        ):
+        """
+        Resets the clock and the queues, and adds `N_start_processes` new processes to the ready queues.
+        The ready queues are then kept at `N_items_to_keep_ready` processes until `N_processes` have been generated.
+        """
+        global _process_counter, _process_counter_mutex
+
+        _process_counter_mutex.acquire()
+        _process_counter = 0
+        _process_counter_mutex.release()
+
+        self.clock = 0.0
+        self.ready_queues = [ReadyQueue(clock=self.now) for _ in self.dispatcher.CPUs]
+        self.completed_queue = CompletedQueue(clock=self.now)
+        for cpu in self.dispatcher.CPUs:
+            cpu.running_process = None
+            cpu.last_process = None
+            cpu.busy_time = 0.0
+        self.dispatcher.steals = 0
+        self.__events__ = []
+        self.__dispatching__ = set()
+        self.__slices__ = {}
+
+        self.N_items_to_keep_ready = N_items_to_keep_ready
+        self.N_processes = N_processes
+        self.N_generated = 0
+
+        for _ in range(N_start_processes):
+            self.__generate__()
+
+    def add_arrival(self, item: QueueItem, at: float | None = None):
+        """
+        Schedules the arrival of a process in the ready queues at time `at` (by default now).
+        """
+        self.__schedule__(self.clock if at is None else at, Event.ARRIVAL, item=item)
+
+    def __schedule__(self, at: float, event: int, core: int = 0, item: QueueItem | None = None) -> int:
+        self.__seq__ += 1
+        heapq.heappush(self.__events__, (at, event, self.__seq__, core, item))
+        return self.__seq__
+
+    def __schedule_dispatch__(self, core: int):
+        if self.dispatcher.CPUs[core].running_process is None and core not in self.__dispatching__:
+            self.__dispatching__.add(core)
+            self.__schedule__(self.clock, Event.DISPATCH, core)
+
+    def __generate__(self) -> bool:
+        """
+        Adds a new process to the ready queues, returns `False` if `N_processes` have been generated already.
+        """
+        if self.N_processes is not None and self.N_generated >= self.N_processes:
+            return False
+        self.N_generated += 1
+        self.__arrive__(self.queue_item_generator.generate_item())
+        return True
+
+    def __top_up__(self):
+        for _ in range(self.N_items_to_keep_ready - self.n_ready()):
+            if not self.__generate__():
+                break
+
+    def __arrive__(self, item: QueueItem):
+        core = self.dispatcher.place(self.ready_queues)
+        item.process.state = ProcessState.READY
+        self.ready_queues[core].add(item)
+
+        running = self.__slices__.get(core)
+        if running is None:
+            self.__schedule_dispatch__(core)
+            return
+        _, running_item, start, cost, run = running
+        done = min(max(0.0, self.clock - start - cost), run)
+        if self.scheduler.preempts(running_item, running_item.process.remaining_bt - done, item):
+            if _verbose:
+                print(f"{self.clock:.2f}: Process {item.process.id} preempts process {running_item.process.id} on core {core}")
+            # Only the part of the context switch done so far counts
+            running_item.process.cs_time -= cost - min(cost, self.clock - start)
+            del self.__slices__[core]
+            self.__end_slice__(core, running_item, done)
+
+    def __dispatch__(self, core: int):
+        global _verbose
+
+        self.__dispatching__.discard(core)
+        cpu = self.dispatcher.CPUs[core]
+        if cpu.running_process is not None:
+            return
+        queue_item = self.dispatcher.select(self.scheduler, self.ready_queues[core], self.ready_queues)
+        if queue_item is None:
+            return
+        if _verbose:
+            print(f"{self.clock:.2f}: Process {queue_item.process.id} has been selected to run on core {core}")
+
+        process = queue_item.process
+        process.state = ProcessState.RUNNING
+        process.wt += self.clock - queue_item.arrival_time
+        cost = cpu.context_switch(process, self.dispatcher.context_switch_cost)
+        run = process.next_burst(self.scheduler.time_slice(queue_item))
+        cpu.running_process = process
+        seq = self.__schedule__(self.clock + cost + run, Event.COMPLETION, core, queue_item)
+        self.__slices__[core] = (seq, queue_item, self.clock, cost, run)
+
+    def __complete__(self, core: int, queue_item: QueueItem, seq: int):
+        running = self.__slices__.get(core)
+        if running is None or running[0] != seq:
+            return  # the process has been preempted
+        del self.__slices__[core]
+        self.__end_slice__(core, queue_item, running[-1])
+
+    def __end_slice__(self, core: int, queue_item: QueueItem, run: float):
+        """
+        Takes the process off the core after it ran for `run`: to the completed queue if it is done,
+        back to the ready queue of the core otherwise.
+        """
+        cpu = self.dispatcher.CPUs[core]
+        process = queue_item.process
+        process.remaining_bt -= run
+        process.ttc += run
+        cpu.running_process = None
+        cpu.busy_time += run
+        if process.remaining_bt > 0:
+            process.state = ProcessState.READY
+            self.scheduler.preempted(queue_item)
+            self.ready_queues[core].add(queue_item)
+        else:
+            process.state = ProcessState.TERMINATED
+            self.completed_queue.add(queue_item)
+        self.__top_up__()
+        self.__schedule_dispatch__(core)
+
+    def step(self) -> bool:
+        """
+        Handles the next event, returns `False` if there are none left.
+        """
+        if not self.__events__:
+            return False
+        self.clock, event, seq, core, item = heapq.heappop(self.__events__)
+        if event == Event.ARRIVAL:
+            self.__arrive__(item)
+        elif event == Event.DISPATCH:
+            self.__dispatch__(core)
+        else:
+            self.__complete__(core, item, seq)
+        return True
+
+    def run(self, until: float | None = None) -> dict:
+        """
+        Runs the simulation until there are no events left, or until the virtual time `until`.
+
+        ## Returns
+        - dict: `CompletedQueue.stats` of the run, with the `utilization` of the CPU, the `core_utilization` of each core
+          and the number of `steals`
+        """
+        self.__top_up__()
+        for core, queue in enumerate(self.ready_queues):
+            if not queue.is_empty():
+                self.__schedule_dispatch__(core)
+
+        while self.__events__ and (until is None or self.__events__[0][0] <= until):
+            self.step()
+
+        stats = self.completed_queue.stats()
+        core_utilization = self.dispatcher.utilization(self.clock)
+        stats["utilization"] = sum(core_utilization) / len(core_utilization)
+        stats["core_utilization"] = core_utilization
+        stats["steals"] = self.dispatcher.steals
+        return stats
+
+
+def generate_arrivals(N_processes: int, mean_interarrival: float = 1.0, **kwargs) -> list[tuple[float, QueueItem]]:
+    """
+    Generates `N_processes` new processes (see `QueueItemGenerator.generate_item` for `kwargs`)
+    arriving at random, on average every `mean_interarrival` seconds (a Poisson process).
+
+    ## Returns
+    - list: `(arrival time, QueueItem)` for `EventSimulation.add_arrival`
+    """
+    generator = QueueItemGenerator()
+    arrivals = []
+    at = 0.0
+    for _ in range(N_processes):
+        at += random.expovariate(1 / mean_interarrival)
+        arrivals.append((at, generator.generate_item(**kwargs)))
+    return arrivals
+
+
+def compare_policies(schedulers: list[BaseSchedular],
+                     arrivals: list[tuple[float, QueueItem]],
+                     n_cores: int = 1,
+                     context_switch_cost: float = 0.0,
+    ) -> dict[str, dict]:
+    """
+    Runs the same workload with each of the schedulers in an `EventSimulation`, each on a copy of the processes.
+
+    ## Returns
+    - dict: `EventSimulation.run` stats by name of the scheduler
+    """
+    results = {}
+    for scheduler in schedulers:
+        sim = EventSimulation(scheduler, n_cores, context_switch_cost)
+        for at, item in copy.deepcopy(arrivals):
+            sim.add_arrival(item, at)
+        results[str(scheduler)] = sim.run()
+    return results
+
+# endregion
+
+
 # region Testing
 def arrange():
     """
@@ -660,9 +1467,119 @@ def module_test_2():
 
     print("MODULE TEST 2 \t PASSED")
 
+def module_test_3():
+    """
+    See if the discrete-event simulation selects the same processes in the same order as the emulation,
+    with about the same times to complete
+    """
+    # Arrange
+    queue_item_generator, scheduler, ready_queue, dispatcher, completed_queue = arrange()
+    scheduler.age_threshold = 2
+    sim = EventSimulation(Schedular(age_threshold=2))
+
+    # Generate the same processes for both
+    N_processes_to_generate = 10
+    state = random.getstate()
+    for _ in range(N_processes_to_generate):
+        ready_queue.add(queue_item_generator.generate_item())
+    random.setstate(state)
+    for _ in range(N_processes_to_generate):
+        sim.add_arrival(queue_item_generator.generate_item())
+
+    # Act
+    for _ in range(N_processes_to_generate):
+        dispatcher.dispatch(scheduler, ready_queue, completed_queue)
+    sim.run()
+
+    # Assert
+    assert [q.process.burst_times for q in completed_queue] == [q.process.burst_times for q in sim.completed_queue]
+    for emulated, simulated in zip(completed_queue, sim.completed_queue):
+        assert abs(emulated.process.ttc - simulated.process.ttc) < 0.1
+    assert abs(completed_queue.stats()["mean_tat"] - sim.completed_queue.stats()["mean_tat"]) < 0.5
+
+    print("MODULE TEST 3 \t PASSED")
+
+def module_test_4():
+    """
+    Run the same workload with every scheduling policy, and see if all processes complete,
+    taking the same CPU time, and SRTF has the lowest mean turnaround time (it is optimal without context switch cost)
+    """
+    # Arrange
+    arrange()
+    N_processes_to_generate = 1000
+    arrivals = generate_arrivals(N_processes_to_generate, mean_interarrival=3.0)
+    schedulers = [
+        FCFSSchedular(),
+        Schedular(age_threshold=10),
+        SRTFSchedular(),
+        RoundRobinSchedular(quantum=0.5),
+        MLFQSchedular(quanta=(0.5, 1.0, None)),
+    ]
+
+    # Act
+    results = compare_policies(schedulers, arrivals)
+
+    # Assert
+    total_ttc = sum(item.process.max_bt for _, item in arrivals)
+    for stats in results.values():
+        assert stats["processes"] == N_processes_to_generate
+        assert abs(stats["mean_ttc"] * stats["processes"] - total_ttc) < 1e-6 * total_ttc
+    assert min(results.values(), key=lambda stats: stats["mean_tat"]) is results[str(SRTFSchedular())]
+
+    print("MODULE TEST 4 \t PASSED")
+
+def module_test_5():
+    """
+    See if the schedular selects the processes in the same order as when the ready queue was a list,
+    sorted (stably) on every selection and aging every process left in it by one, on seeded workloads
+    with processes arriving in between selections
+    """
+    # Arrange
+    queue_item_generator, scheduler, ready_queue, _, _ = arrange()
+    N_processes_to_generate = 30
+    state = random.getstate()
+
+    for seed in range(50):
+        for age_threshold in (1, 2, 3, 5, 10):
+            random.seed(seed)
+            scheduler.age_threshold = age_threshold
+            ready_queue = ReadyQueue()
+            expected_queue = []     # [item, age]
+            selected, expected = [], []
+
+            # Act
+            def select():
+                selected.append(scheduler.select_process(ready_queue).process.id)
+                if any(age >= age_threshold for _, age in expected_queue):
+                    expected_queue.sort(key=lambda entry: (-entry[1], -entry[0].process.bt_sum))
+                else:
+                    expected_queue.sort(key=lambda entry: entry[0].process.avg_bt)
+                expected.append(expected_queue.pop(0)[0].process.id)
+                for entry in expected_queue:
+                    entry[1] += 1
+
+            for _ in range(N_processes_to_generate):
+                for _ in range(random.randint(0, 3)):
+                    item = queue_item_generator.generate_item(n_threads=random.randint(1, 4))
+                    ready_queue.add(item)
+                    expected_queue.append([item, 0])
+                if random.random() < 0.7 and expected_queue:
+                    select()
+            while expected_queue:
+                select()
+
+            # Assert
+            assert selected == expected, (seed, age_threshold)
+
+    random.setstate(state)
+    print("MODULE TEST 5 \t PASSED")
+
 if _run_tests:
     module_test_1()
     module_test_2()
+    module_test_3()
+    module_test_4()
+    module_test_5()
 
     # TODO Check why the code bellow works on one machine but not on the other
     # tests_to_run = [
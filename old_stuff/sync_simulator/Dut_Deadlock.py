@@ -0,0 +1,33 @@
+from Environment import *
+from Environment import _blk
+
+# two threads that take the same two mutexes in opposite order (compare resit/week_1/deadlock.py):
+# it may run fine for quite a while, until each of them holds one of the mutexes;
+# then the simulator stops and shows the cycle
+
+fork_a = MyMutex("fork_a")
+fork_b = MyMutex("fork_b")
+meals = MyInt(0, "meals")
+
+
+def threadAB():
+    while True:
+        fork_a.wait()
+        fork_b.wait()
+        meals.v += 1
+        fork_b.signal()
+        fork_a.signal()
+
+
+def threadBA():
+    while True:
+        fork_b.wait()
+        fork_a.wait()
+        meals.v += 1
+        fork_a.signal()
+        fork_b.signal()
+
+
+def setup():
+    subscribe_thread(threadAB)
+    subscribe_thread(threadBA)
@@ -0,0 +1,34 @@
+from Environment import *
+from Environment import _blk
+
+# readers-writers with a lightswitch (see LBoS, par 4.2.2): any number of readers can be in the room
+# at the same time, a writer only when it is empty; set N (e.g. N=10000) for many readers, see
+# 'backend' in main.py or --backend in batch.py
+
+N = 5
+WRITERS = 2
+
+roomEmpty = MySemaphore(1, "roomEmpty")
+readLightswitch = MyLightswitch(roomEmpty, "readLightswitch")
+data = MyInt(0, "data")
+
+
+def reader():
+    while True:
+        readLightswitch.lock(roomEmpty)
+        x = data.v
+        readLightswitch.unlock(roomEmpty)
+
+
+def writer():
+    while True:
+        roomEmpty.wait()
+        data.v = data.v + 1
+        roomEmpty.signal()
+
+
+def setup():
+    for i in range(WRITERS):
+        subscribe_thread(writer)
+    for i in range(N):
+        subscribe_thread(reader)
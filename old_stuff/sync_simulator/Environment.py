@@ -1,24 +1,31 @@
+import _thread
+import ast
+import collections
+import contextlib
+import bisect
 import functools
-import inspect
+import hashlib
+import heapq
+import importlib.util
+import json
+import pathlib
+import queue
 import random
+import sys
 import threading
+import time
 import tkinter as tk
 import tkinter.messagebox  # jg: why needed???
-import time
-from typing import Any, Dict, List
+from types import CodeType
+from typing import Any, Callable, Dict, List, Tuple
 
-thread_blockable: Dict[Any, Any] = {}
-breakpoints_threads: Dict[Any, Any] = {}
-breakpoints_general: Dict[Any, Any] = {}
-thread_index_list: Dict[Any, Any] = {}
-threads_nrof: int = 0
-lines_nrof: int = 0
-subscribed_threads: List[Any] = []
-subscribed_objects: List[Any] = []
-block_step = Any
-speed = Any
+try:
+    import greenlet
+except ImportError:     # optional: only the greenlet backend needs it
+    greenlet = None
 
-gui = Any
+# per thread: its SimulationContext, see current_context(); a DUT thread gets the one it was subscribed in
+_active = threading.local()
 
 
 def getCallerInfo():
@@ -27,11 +34,98 @@ def getCallerInfo():
     # aaa()             ->   bbb()       ->   ccc() ->   getCallerInfo()
     # ^ great-grand-caller   ^ grand-caller   ^ caller   ^ we are here
     # we want to know the lino of ccc's call inside bbb()
-    frame = inspect.currentframe()  # here
-    frame = frame.f_back            # caller
-    frame = frame.f_back            # grand-caller
-    filename, lineno, function, code_context, index = inspect.getframeinfo(frame)
-    return filename, lineno
+    # note: no inspect.getframeinfo() here, it reads the source (linecache) on every call
+    frame = sys._getframe(2)        # grand-caller
+    return frame.f_code, frame.f_lineno
+
+
+def _code_objects(code):
+    # the code object itself plus all nested ones (functions, lambdas, comprehensions)
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            yield from _code_objects(const)
+
+
+# methods of the My* objects that call _blk(getCallerInfo()), i.e. stop at the line of their caller
+BLOCKING_METHODS = {"wait", "signal", "lock", "unlock", "notify", "notify_all"}
+
+
+def _bound_names(target):
+    if isinstance(target, ast.Name):
+        yield target.id
+    elif isinstance(target, ast.Attribute):
+        yield target.attr
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from _bound_names(element)
+
+
+def _call_name(func):
+    return func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+
+
+def find_breakable_lines(source):
+    """
+    the lines of a DUT source where a thread can stop: calls of _blk() and of the blocking methods of
+    My* objects (a name/attribute that is bound to one, or unknown here, e.g. a parameter); an element of a
+    container (q[0].wait()) or the result of a call (get_sem().wait()) always counts as one, whatever the
+    container was bound to: it may be filled later (q = [] ... q.append(MySemaphore()))
+    """
+    tree = ast.parse(source)
+    my_names = set()
+    other_names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if any(isinstance(n, ast.Call) and (_call_name(n.func) or "").startswith("My")
+                   for n in ast.walk(node.value)):
+                bound = my_names
+            elif isinstance(node.value, (ast.Name, ast.Attribute, ast.Subscript)):
+                continue    # a copy of something else: could be a My* object
+            else:
+                bound = other_names
+            for target in targets:
+                bound.update(_bound_names(target))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            other_names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    lines = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == "_blk":
+            lines.add(func.end_lineno)
+        elif isinstance(func, ast.Attribute) and func.attr in BLOCKING_METHODS:
+            base = func.value
+            name = _call_name(base) if isinstance(base, (ast.Name, ast.Attribute)) else None
+            if name is None or name in my_names or name not in other_names:
+                # the line number the interpreter reports for a method call (getCallerInfo) is the one of
+                # the end of 'object.method'
+                lines.add(func.end_lineno)
+    return sorted(lines)
+
+
+def breakable_lines(filepath):
+    """ find_breakable_lines() of a DUT file, cached in __pycache__ by the hash of its contents """
+    filepath = pathlib.Path(filepath)
+    source = filepath.read_bytes()
+    # the analysis version and the interpreter are part of the key: both determine the line numbers
+    key = 'v2:{}:{}'.format(sys.implementation.cache_tag, hashlib.sha256(source).hexdigest())
+    cache = filepath.parent / "__pycache__" / (filepath.stem + ".breakable.json")
+    try:
+        cached = json.loads(cache.read_text())
+        if cached["key"] == key:
+            return cached["lines"]
+    except (OSError, ValueError, KeyError):
+        pass
+    lines = find_breakable_lines(source)
+    try:
+        cache.parent.mkdir(exist_ok=True)
+        cache.write_text(json.dumps({"key": key, "lines": lines}))
+    except OSError:
+        pass
+    return lines
 
 
 class MySemaphore(threading.Semaphore):
@@ -39,7 +133,9 @@ class MySemaphore(threading.Semaphore):
     def __init__(self, val=0, name="? (SZN)"):
         threading.Semaphore.__init__(self, val)
         self._name = name
-        subscribed_objects.append(self)
+        self._version = 0       # incremented on every change, the gui re-renders changed objects only
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
         return 'sem  {:20}: {:1}\n'.format(self._name, self.get_value())
@@ -48,16 +144,44 @@ class MySemaphore(threading.Semaphore):
         # for debug/gui purposes only!
         return self._value
 
+    def snapshot(self):
+        return self._value
+
     def wait(self):
-        _blk(getCallerInfo())
-        self.acquire()
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if ctx.metrics is not None:
+                start = ctx.metrics.begin(self, "wait")
+            while not self.acquire(blocking=False):
+                ctx.scheduler.park(self)
+            if ctx.races is not None:
+                ctx.races.acquire(self)
+            self._version += 1
+            if ctx.metrics is not None:
+                ctx.metrics.acquired(self, start)
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "wait", self._value + 1, self._value)
 
     def signal(self, n=1):
-        _blk(getCallerInfo())
-        for i in range(n):
-            self.release()
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if ctx.races is not None:
+                ctx.races.release(self)
+            before = self._value
+            for i in range(n):
+                self.release()
+            ctx.scheduler.unpark(self)
+            self._version += 1
+            if ctx.metrics is not None:
+                ctx.metrics.released(self, "signal")
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "signal", before, self._value)
 
 
 class MyMutex(object):  # jg: inheritance from threading.Lock doesn't work; why???
@@ -66,26 +190,57 @@ class MyMutex(object):  # jg: inheritance from threading.Lock doesn't work; why?
     def __init__(self, name="? (MZN)"):
         # threading.Semaphore.__init__(self)
         self._name = name
-        self._lock = threading.Lock()  # composition instead of inheritance
+        # the status (locked/unlocked) is maintained explicitly; blocking is done by the scheduler,
+        # so a headless run can tell a blocked thread from a running one
         self.avail = True
-        # only for gui-show (JG: how to get the status (locked/unlocked) from the Lock-object
-        # itself? (instead of maintaining explicitly))
-        subscribed_objects.append(self)
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
         return 'mux  {:20}: {}\n'.format(self._name, self.avail)
 
+    def snapshot(self):
+        return self.avail
+
     def wait(self):
-        _blk(getCallerInfo())
-        self._lock.acquire()
-        self.avail = False
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if ctx.metrics is not None:
+                start = ctx.metrics.begin(self, "wait")
+            while not self.avail:
+                ctx.scheduler.park(self)
+            self.avail = False
+            ctx.scheduler.acquired(self)
+            if ctx.races is not None:
+                ctx.races.acquire(self)
+            self._version += 1
+            if ctx.metrics is not None:
+                ctx.metrics.acquired(self, start)
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "wait", True, False)
 
     def signal(self):
-        _blk(getCallerInfo())
-        self.avail = True
-        self._lock.release()
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if self.avail:
+                raise RuntimeError("release unlocked mutex '{}'".format(self._name))
+            if ctx.races is not None:
+                ctx.races.release(self)
+            self.avail = True
+            ctx.scheduler.released(self)
+            ctx.scheduler.unpark(self)
+            self._version += 1
+            if ctx.metrics is not None:
+                ctx.metrics.released(self, "signal")
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "signal", False, True)
 
 
 class MyLightswitch(object):
@@ -97,35 +252,66 @@ class MyLightswitch(object):
         self._mutex = MyMutex()
         self._sem = sem
         self._counter = 0
-        subscribed_objects.append(self)
+        self._changes = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
         return 'lsw  {:20}: mu:{},se:{},#:{}\n'.format(self._name, self._mutex.avail, self._sem.get_value(),
                                                        self._counter)
 
+    @property
+    def _version(self):
+        # its line also shows its mutex and semaphore
+        return self._changes + self._mutex._version + self._sem._version
+
+    def snapshot(self):
+        return self._counter
+
     def lock(self, sem):
-        _blk(getCallerInfo())
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
         if not self._sem == sem:
-            tk.messagebox.showinfo('Lightswitch violation in wait()',
-                                   'modified sem in {}'.format(threading.get_ident(), self))
+            ctx.scheduler.warn('Lightswitch violation in wait()', 'modified sem in {}'.format(threading.get_ident(), self))
+        if ctx.metrics is not None:
+            with ctx.scheduler.lock:
+                start = ctx.metrics.begin(self, "lock")
         self._mutex.wait()
         self._counter += 1
+        self._changes += 1
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "lock", self._counter - 1, self._counter)
         if self._counter == 1:
             self._sem.wait()
+        with ctx.scheduler.lock:
+            # the threads in the room hold its semaphore together, until the last one leaves
+            ctx.scheduler.acquired(self._sem)
+            if ctx.metrics is not None:
+                ctx.metrics.acquired(self, start)
         self._mutex.signal()
-        gui.show_subscriptions(subscribed_objects)
 
     def unlock(self, sem):
-        _blk(getCallerInfo())
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
         if not self._sem == sem:
-            tk.messagebox.showinfo('Lightswitch violation in signal()',
-                                   'modified sem in {}'.format(threading.get_ident(), self))
+            ctx.scheduler.warn('Lightswitch violation in signal()', 'modified sem in {}'.format(threading.get_ident(), self))
         self._mutex.wait()
         self._counter -= 1
+        self._changes += 1
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "unlock", self._counter + 1, self._counter)
+        with ctx.scheduler.lock:
+            ctx.scheduler.released(self._sem)
         if self._counter == 0:
             self._sem.signal()
+        if ctx.metrics is not None:
+            with ctx.scheduler.lock:
+                ctx.metrics.released(self, "unlock")
         self._mutex.signal()
-        gui.show_subscriptions(subscribed_objects)
 
 
 class MyConditionVariable(object):
@@ -133,79 +319,211 @@ class MyConditionVariable(object):
 
     def __init__(self, mutex, name="? (CZN)"):
         self._name = name
-        self._condvar = threading.Condition(mutex._lock)
         self._mutex = mutex
-        subscribed_objects.append(self)
+        self._waiters = collections.deque()     # per waiting thread: [notified, thread index]
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
         return 'con  {:20}: {}\n'.format(self._name, "...")
 
+    def snapshot(self):
+        return tuple(waiter[1] for waiter in self._waiters)
+
     def wait(self):
-        _blk(getCallerInfo())
-        self._condvar.wait()
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+            ctx.access_hook(self._mutex, True)
+        waiter = [False, ctx.scheduler.thread_index()]
+        with ctx.scheduler.lock:
+            if self._mutex.avail:
+                raise RuntimeError("cannot wait on un-acquired lock")
+            if ctx.metrics is not None:
+                start = ctx.metrics.begin(self, "wait")
+            self._waiters.append(waiter)
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "wait", len(self._waiters) - 1, len(self._waiters))
+            if ctx.races is not None:
+                ctx.races.release(self._mutex)
+            self._mutex.avail = True
+            self._mutex._version += 1
+            self._version += 1
+            ctx.scheduler.released(self._mutex)
+            ctx.scheduler.unpark(self._mutex)
+            while not waiter[0]:
+                ctx.scheduler.park(self)
+            while not self._mutex.avail:
+                ctx.scheduler.park(self._mutex)
+            self._mutex.avail = False
+            self._mutex._version += 1
+            ctx.scheduler.acquired(self._mutex)
+            if ctx.races is not None:
+                ctx.races.acquire(self)
+                ctx.races.acquire(self._mutex)
+            if ctx.metrics is not None:
+                ctx.metrics.acquired(self, start, hold=False)
 
     def notify(self):
-        _blk(getCallerInfo())
-        self._condvar.notify()
-        gui.show_subscriptions(subscribed_objects)
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if self._mutex.avail:
+                raise RuntimeError("cannot notify on un-acquired lock")
+            if ctx.races is not None:
+                ctx.races.release(self)
+            if self._waiters:
+                self._waiters.popleft()[0] = True
+                self._version += 1
+                ctx.scheduler.unpark(self)
+                if ctx.metrics is not None:
+                    ctx.metrics.count(self, "notify")
+                if ctx.trace_hook is not None:
+                    ctx.trace_hook(self, "notify", len(self._waiters) + 1, len(self._waiters))
 
     def notify_all(self):
-        _blk(getCallerInfo())
-        self._condvar.notify_all()
-        gui.show_subscriptions(subscribed_objects)
-
-
-class MyBarrier(threading.Barrier):
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if self._mutex.avail:
+                raise RuntimeError("cannot notify on un-acquired lock")
+            if ctx.races is not None:
+                ctx.races.release(self)
+            before = len(self._waiters)
+            while self._waiters:
+                self._waiters.popleft()[0] = True
+            self._version += 1
+            ctx.scheduler.unpark(self)
+            if ctx.metrics is not None:
+                ctx.metrics.count(self, "notify_all")
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "notify_all", before, 0)
+
+
+class MyBarrier(object):
     """ barrier to be used in a DUT """
 
     def __init__(self, val=0, name="? (BZN)"):
-        threading.Barrier.__init__(self, val)
+        if val < 1:
+            raise ValueError("parties must be > 0")
         self._name = name
         self._parties = val
-        subscribed_objects.append(self)
+        self._count = 0
+        self._generation = 0
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
         return 'bar  {:20}: {:1}/{}\n'.format(self._name, self.n_waiting, self._parties)
 
-    def wait(self):
-        _blk(getCallerInfo())
-        threading.Barrier.wait(self)
-        gui.show_subscriptions(subscribed_objects)
+    @property
+    def n_waiting(self):
+        return self._count
 
+    def snapshot(self):
+        return self._count
 
-class MyInt(object):
+    def wait(self):
+        ctx = self._ctx
+        ctx.blk(getCallerInfo())
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        with ctx.scheduler.lock:
+            if ctx.metrics is not None:
+                start = ctx.metrics.begin(self, "wait")
+            generation = self._generation
+            if ctx.races is not None:
+                ctx.races.release(self, generation)
+            self._count += 1
+            self._version += 1
+            if ctx.trace_hook is not None:
+                ctx.trace_hook(self, "wait", self._count - 1, self._count % self._parties)
+            if self._count == self._parties:
+                self._count = 0
+                self._generation += 1
+                ctx.scheduler.unpark(self)
+            else:
+                while self._generation == generation:
+                    ctx.scheduler.park(self)
+            if ctx.races is not None:
+                ctx.races.acquire(self, generation)
+            if ctx.metrics is not None:
+                ctx.metrics.acquired(self, start, hold=False)
+
+
+class _SharedValue(object):
+    """ .v of a shared value; reads and writes are reported to access_hook and the race detector """
+
+    @property
+    def v(self):
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, False)
+        if ctx.races is not None:
+            ctx.races.access(self, False, "read")
+        return self._v
+
+    @v.setter
+    def v(self, val):
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        if ctx.races is not None:
+            ctx.races.access(self, True, "write")
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "write", self._v, val)
+        self._v = val
+        self._version += 1
+
+    def snapshot(self):
+        return self._v
+
+
+class MyInt(_SharedValue):
     """ integer to be used in a DUT """
 
     def __init__(self, val=0, name="? (IZN)"):
-        self.v = val
+        self._v = val
         self._name = name
-        subscribed_objects.append(self)
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
-        return 'int  {:20}: {:1}\n'.format(self._name, self.v)
+        return 'int  {:20}: {:1}\n'.format(self._name, self._v)
 
 
-class MyString(object):
+class MyString(_SharedValue):
     """ string to be used in a DUT """
 
     def __init__(self, val, name="? (SZN)"):
-        self.v = val
+        self._v = val
         self._name = name
-        subscribed_objects.append(self)
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
-        return 'str  {:20}: {:1}\n'.format(self._name, self.v)
+        return 'str  {:20}: {:1}\n'.format(self._name, self._v)
 
 
-class MyBool(object):
+class MyBool(_SharedValue):
     def __init__(self, val=False, name="? (bZN)"):
-        self.v = val
+        self._v = val
         self._name = name
-        subscribed_objects.append(self)
+        self._version = 0
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def __str__(self):
-        return 'bool {:20}: {}\n'.format(self._name, str(self.v))
+        return 'bool {:20}: {}\n'.format(self._name, str(self._v))
 
 
 class MyFifo(object):
@@ -213,31 +531,86 @@ class MyFifo(object):
     def __init__(self, size, name="? (FZN)"):
         self._max = size
         self._name = name
-        self._data = []
-        subscribed_objects.append(self)
+        # ring buffer: _count items from _head on
+        self._data = [None] * size
+        self._head = 0
+        self._count = 0
+        self._version = 0
+        self._rendered = None   # [version, str()] of the last rendering
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
+
+    def _items(self):
+        end = self._head + self._count
+        if end <= self._max:
+            return self._data[self._head:end]
+        return self._data[self._head:] + self._data[:end - self._max]
 
     def size(self):
-        return len(self._data)
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, False)
+        if ctx.races is not None:
+            ctx.races.access(self, False, "size")
+        return self._count
 
     def peek(self):
-        if len(self._data) == 0:
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, False)
+        if ctx.races is not None:
+            ctx.races.access(self, False, "peek")
+        if self._count == 0:
             return None
-        return self._data[0]
+        return self._data[self._head]
 
     def get(self):
-        return self._data.pop(0)
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        if ctx.races is not None:
+            ctx.races.access(self, True, "get")
+        if self._count == 0:
+            raise IndexError("FIFO get() from empty '{}'".format(self._name))
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "get", self._count, self._count - 1)
+        # changed under the scheduler lock and the version last, so the gui thread renders (see __str__)
+        # either the old contents with the old version or the new ones
+        with ctx.scheduler.lock:
+            val = self._data[self._head]
+            self._data[self._head] = None
+            self._head = (self._head + 1) % self._max
+            self._count -= 1
+            self._version += 1
+        return val
 
     def put(self, val):
-        if self.size() == self._max:
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        if ctx.races is not None:
+            ctx.races.access(self, True, "put")
+        if self._count == self._max:
             raise Exception("FIFO overflow for '{}': {}".format(val, self))
-        return self._data.append(val)
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "put", self._count, self._count + 1)
+        with ctx.scheduler.lock:
+            self._data[(self._head + self._count) % self._max] = val
+            self._count += 1
+            self._version += 1
 
     def __str__(self):
-        if len(self._data) == 0:
-            s = ""
-        else:
-            s = functools.reduce(lambda a, b: a + "," + b, self._data)
-        return 'fif  {:20}: {}/{} [ {} ]\n'.format(self._name, self.size(), self._max, s)
+        # rebuilt only when the contents changed
+        if self._rendered is None or self._rendered[0] != self._version:
+            # with the gui, the DUT threads change the FIFO while it is rendered: a consistent copy
+            with self._ctx.scheduler.lock:
+                version, count, items = self._version, self._count, self._items()
+            self._rendered = [version, 'fif  {:20}: {}/{} [ {} ]\n'.format(
+                self._name, count, self._max, ",".join(str(v) for v in items))]
+        return self._rendered[1]
+
+    def snapshot(self):
+        return tuple(self._items())
 
 
 class MyBag(object):
@@ -245,134 +618,980 @@ class MyBag(object):
     def __init__(self, size=5, name="? (BZN)"):
         self._max = size
         self._name = name
-        self._data = []
-        subscribed_objects.append(self)
+        # counted multiset: value -> number of times it is in the bag (values must be hashable);
+        # rendered in the order in which the values came in
+        self._data = {}
+        self._count = 0
+        self._version = 0
+        self._rendered = None   # [version, str()] of the last rendering
+        self._ctx = current_context()
+        self._ctx.subscribed_objects.append(self)
 
     def size(self):
-        return len(self._data)
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, False)
+        if ctx.races is not None:
+            ctx.races.access(self, False, "size")
+        return self._count
 
     def contains(self, val):
-        return not self._data.count(val) == 0
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, False)
+        if ctx.races is not None:
+            ctx.races.access(self, False, "contains")
+        return val in self._data
 
     def get(self, val):
-        if not self.contains(val):
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        if ctx.races is not None:
+            ctx.races.access(self, True, "get")
+        n = self._data.get(val)
+        if n is None:
             raise Exception("Bag get() for '{}': {}".format(val, self))
-        return self._data.remove(val)
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "get", self._count, self._count - 1)
+        # changed under the scheduler lock and the version last, so the gui thread renders (see __str__)
+        # either the old contents with the old version or the new ones
+        with ctx.scheduler.lock:
+            if n == 1:
+                del self._data[val]
+            else:
+                self._data[val] = n - 1
+            self._count -= 1
+            self._version += 1
 
     def put(self, val):
-        if self.size() == self._max:
+        ctx = self._ctx
+        if ctx.access_hook is not None:
+            ctx.access_hook(self, True)
+        if ctx.races is not None:
+            ctx.races.access(self, True, "put")
+        if self._count == self._max:
             raise Exception("Bag overflow for '{}': {}".format(val, self))
-        return self._data.append(val)
+        if ctx.trace_hook is not None:
+            ctx.trace_hook(self, "put", self._count, self._count + 1)
+        with ctx.scheduler.lock:
+            self._data[val] = self._data.get(val, 0) + 1
+            self._count += 1
+            self._version += 1
 
     def __str__(self):
-        if len(self._data) == 0:
-            s = ""
+        # rebuilt only when the contents changed
+        if self._rendered is None or self._rendered[0] != self._version:
+            # copied under the lock: with the gui, the DUT threads change the dict while it is rendered
+            with self._ctx.scheduler.lock:
+                version, count, items = self._version, self._count, list(self._data.items())
+            s = ",".join(",".join([str(v)] * n) for v, n in items)
+            self._rendered = [version, 'bag  {:20}: {}/{} [ {} ]\n'.format(self._name, count, self._max, s)]
+        return self._rendered[1]
+
+    def snapshot(self):
+        # the same contents are the same state, whatever the order they came in
+        return frozenset(self._data.items())
+
+
+gim = threading.Lock()
+
+
+def _blk(caller=None):
+    if caller is None:
+        caller = getCallerInfo()
+    current_context().blk(caller)
+
+
+class WaitForGraph(object):
+    """
+    which thread waits for which object and which threads hold it; kept up to date on every wait/signal,
+    so looking for a cycle is cheap enough to do on every blocking operation;
+    only objects released by their owner have holders (mutexes, the semaphore of a lightswitch while threads
+    are in its room): a counting semaphore can be signalled by any thread, a wait for it is a wait for a signal
+    """
+
+    def __init__(self):
+        self.live = set()       # threads that are started and not finished
+        self.waiting = {}       # thread -> object it is blocked on
+        self.holders = {}       # object -> {thread: units held} (mutex, lightswitch semaphore)
+        self.cycle = None       # last cycle found: [(thread, object), ...]
+
+    def acquired(self, obj, thread_index):
+        holders = self.holders.get(obj)
+        if holders is None:
+            holders = self.holders[obj] = {}
+        holders[thread_index] = holders.get(thread_index, 0) + 1
+
+    def released(self, obj, thread_index):
+        holders = self.holders.get(obj)
+        if holders and thread_index in holders:
+            holders[thread_index] -= 1
+            if holders[thread_index] == 0:
+                del holders[thread_index]
+
+    def all_blocked(self):
+        return len(self.waiting) == len(self.live)
+
+    def _waits_for(self, thread_index):
+        obj = self.waiting.get(thread_index)
+        if obj is None:
+            return ()
+        if isinstance(obj, MyBarrier):
+            # waits for the threads that did not arrive yet
+            return [t for t in self.live if self.waiting.get(t) is not obj]
+        if isinstance(obj, MyConditionVariable):
+            # waits for a notify, by whoever holds the mutex
+            obj = obj._mutex
+        return self.holders.get(obj, ())
+
+    def find_cycle(self, thread_index):
+        # depth-first from the thread that just blocked, back to itself
+        path = [thread_index]
+        todo = [iter(self._waits_for(thread_index))]
+        seen = {thread_index}
+        while todo:
+            nxt = next(todo[-1], None)
+            if nxt is None:
+                todo.pop()
+                path.pop()
+            elif nxt == thread_index:
+                self.cycle = [(t, self.waiting[t]) for t in path]
+                return self.cycle
+            elif nxt not in seen:
+                seen.add(nxt)
+                path.append(nxt)
+                todo.append(iter(self._waits_for(nxt)))
+        return None
+
+    def find_any_cycle(self):
+        # all threads are blocked: look for a cycle from each, the one that blocked last first
+        for thread_index in reversed(list(self.waiting)):
+            if self.find_cycle(thread_index) is not None:
+                return self.cycle
+        return None
+
+    def describe(self, positions, dut_file):
+        """ the blocked threads with file/line, the cycle first """
+        def where(t):
+            return '{}:{}'.format(dut_file, positions.get(t, "?"))
+
+        lines = ['deadlock: {} of {} thread(s) blocked'.format(len(self.waiting), len(self.live))]
+        in_cycle = set()
+        if self.cycle is not None and all(self.waiting.get(t) is obj for t, obj in self.cycle):
+            lines.append('cycle:')
+            for t, obj in self.cycle:
+                in_cycle.add(t)
+                held = sorted(self.holders.get(getattr(obj, "_mutex", obj), ()))
+                lines.append('  thread {} at {} waits for {}, held by thread(s) {}'.format(t, where(t), str(obj).strip(),
+                                                                                          held))
+        for t, obj in sorted(self.waiting.items()):
+            if t not in in_cycle:
+                line = '  thread {} at {} waits for {}'.format(t, where(t), str(obj).strip())
+                if isinstance(obj, MySemaphore) and not self.holders.get(obj):
+                    line += ', no holder / waiting for a signal'
+                lines.append(line)
+        return "\n".join(lines)
+
+
+class SimulationStop(BaseException):
+    """ raised in a DUT thread to unwind it when a headless run is over """
+
+
+class GuiScheduler(object):
+    """ the DUT threads race for real; the gui (buttons, breakpoints, auto-run) releases them at _blk() """
+
+    def __init__(self, context):
+        self.context = context
+        # guards the state of the blocking primitives; a blocked thread waits on it
+        self.lock = threading.Condition()
+        self.graph = WaitForGraph()
+        self.blocked = self.graph.waiting
+        self.positions: Dict[int, int] = {}     # thread -> line of its last _blk()
+        self.now = 0.0                          # virtual time (s), see sleep()
+        self.sleeping: Dict[int, float] = {}    # thread -> virtual time it sleeps until
+        self.at_blk = set()                     # threads stopped at _blk(), they take no virtual time
+        self._parked: Dict[Any, List[int]] = {}
+
+    def start(self):
+        self.context.create_threads()
+        for index in range(self.context.threads_nrof):
+            self.context.thread_wake.setdefault(index, threading.Event())
+        self.graph.live.update(range(self.context.threads_nrof))
+        for t in self.context.subscribed_threads:
+            t.start()
+
+    def enter(self, thread_index):
+        pass
+
+    def leave(self, thread_index):
+        with self.lock:
+            self.graph.live.discard(thread_index)
+            self._advance_clock()
+            self._check_deadlock()
+
+    def crash(self, thread_index, exception):
+        self.leave(thread_index)
+        raise exception
+
+    def warn(self, title, message):
+        self.context.gui.post("info", title, message)
+
+    def thread_index(self):
+        # None: not a DUT thread
+        return self.context.thread_index_list.get(threading.get_ident())
+
+    def acquired(self, obj):
+        self.graph.acquired(obj, self.context.get_thread_index())
+
+    def released(self, obj):
+        self.graph.released(obj, self.context.get_thread_index())
+
+    def park(self, obj):
+        # called with self.lock held: wait until obj has changed
+        thread_index = self.context.get_thread_index()
+        self.blocked[thread_index] = obj
+        self._parked.setdefault(obj, []).append(thread_index)
+        self.graph.find_cycle(thread_index)
+        self._advance_clock()
+        self._check_deadlock()
+        while thread_index in self.blocked:
+            self.lock.wait()
+
+    def unpark(self, obj):
+        waiters = self._parked.pop(obj, None)
+        if waiters:
+            for thread_index in waiters:
+                del self.blocked[thread_index]
+            self.lock.notify_all()
+
+    def sleep(self, seconds):
+        # virtual time: sleep until the other threads have nothing left to do before the due time
+        with self.lock:
+            thread_index = self.context.get_thread_index()
+            self.sleeping[thread_index] = self.now + max(seconds, 0)
+            self._advance_clock()
+            while thread_index in self.sleeping:
+                self.lock.wait()
+
+    def _advance_clock(self):
+        # called with self.lock held: when every live thread is blocked, sleeping or stopped at _blk(), nothing
+        # needs to happen before the first sleeping thread is due, so the clock jumps there; a thread that
+        # keeps stepping so can't starve a sleeping one
+        if self.sleeping and len(self.blocked) + len(self.sleeping) + len(self.at_blk) == len(self.graph.live):
+            self.now = min(self.sleeping.values())
+            for thread_index, due in list(self.sleeping.items()):
+                if due <= self.now:
+                    del self.sleeping[thread_index]
+            self.lock.notify_all()
+
+    def _check_deadlock(self):
+        # every live thread is blocked: nothing can ever change again, so stop and show why
+        if self.blocked and self.graph.all_blocked():
+            report = self.graph.describe(self.positions, self.context.dut_file)
+            print(report)
+            self.context.gui.post("deadlock", report)
+
+    def step(self, line_nbr):
+        context = self.context
+        thread_index = context.get_thread_index()
+        self.positions[thread_index] = line_nbr
+
+        context.gui.post("activate", thread_index, line_nbr)
+        with self.lock:
+            self.at_blk.add(thread_index)
+            self._advance_clock()
+        # print(">> brk:", thread_index, line_nbr, thread_is_blockable(thread_index))
+        # park until released; no polling: the thread sleeps on its wake event, which is set by
+        # the "+" button, a breakpoint/blocking-mode change or (in auto-run) times out after a random delay
+        wake = context.thread_wake[thread_index]
+        while True:
+            wake.clear()
+            if not context.thread_is_blockable(thread_index):
+                break
+            if context.block_all or context.is_breakpoint(thread_index, line_nbr):
+                wake.wait()
+            elif not wake.wait(context.auto_run_delay()):
+                break
+        # print("<< brk:", thread_index, line_nbr, thread_is_blockable(thread_index))
+        with self.lock:
+            self.at_blk.discard(thread_index)
+        context.gui.post("deactivate", thread_index, line_nbr)
+        context.thread_set_blockable(thread_index)
+
+
+class RandomPolicy(object):
+    """ picks the next thread at random; the same seed gives the same interleaving """
+
+    def __init__(self, seed=None, stay=0.0):
+        self.random = random.Random(seed)
+        self.stay = stay    # chance to keep running the current thread (fewer context switches)
+
+    def choose(self, runnable, current):
+        if self.stay and current in runnable and self.random.random() < self.stay:
+            return current
+        return runnable[self.random.randrange(len(runnable))]
+
+
+class RoundRobinPolicy(object):
+    """ lets every runnable thread make one step in turn """
+
+    def choose(self, runnable, current):
+        later = [t for t in runnable if current is None or t > current]
+        return min(later) if later else min(runnable)
+
+
+class ReplayPolicy(object):
+    """ replays a recorded schedule (e.g. HeadlessResult.schedule) and stops when it runs out;
+    run_headless() stops with status "diverged" when the schedule picks a thread that cannot run """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.index = 0
+
+    def choose(self, runnable, current):
+        if self.index == len(self.schedule):
+            return None
+        self.index += 1
+        return self.schedule[self.index - 1]
+
+
+class HeadlessScheduler(object):
+    """
+    token-passing scheduler without gui: exactly one DUT thread runs between two _blk() points,
+    the policy picks the thread that gets the token next (see run_headless())
+    """
+
+    def __init__(self, context, policy, max_steps):
+        self.context = context
+        self.policy = policy
+        self.max_steps = max_steps
+        # only the token holder runs, so there's nothing to guard
+        self.lock = contextlib.nullcontext()
+        self.steps = 0
+        self.schedule: List[int] = []           # the thread picked at every step
+        self.positions: Dict[int, int] = {}     # thread -> line of its last _blk()
+        self.graph = WaitForGraph()
+        self.blocked = self.graph.waiting       # thread -> object it waits for
+        self.suspended: Dict[int, Any] = {}     # thread -> object it is parked on (blocked or woken up)
+        self.now = 0.0                          # virtual time (s), see sleep()
+        self.sleeping: Dict[int, float] = {}    # thread -> virtual time it sleeps until
+        self.finished = set()
+        self.status = None
+        self.exception = None
+        self.diverged = None                    # (step, thread, runnable threads) of a choice that cannot run
+        self.current = None
+        self._runnable: List[int] = []
+        self._parked: Dict[Any, List[int]] = {}
+        self._timers: List[Tuple[float, int]] = []    # heap of (due, thread) of the sleeping threads
+        self._baton: Dict[int, Any] = {}
+        self._stopping = False
+        self._done = threading.Event()
+
+    def run(self):
+        self.context.create_threads()
+        self.graph.live.update(range(self.context.threads_nrof))
+        for index, t in enumerate(self.context.subscribed_threads):
+            self._baton[index] = _thread.allocate_lock()
+            self._baton[index].acquire()
+            self._runnable.append(index)
+            t.start()
+        if self._runnable:
+            try:
+                nxt = self._choose()
+            except BaseException:
+                self._stop("exception")
+                raise
+            if nxt is not None:
+                self.current = nxt
+                self._baton[nxt].release()
+        else:
+            self._stop("finished")
+        self._done.wait()
+        for t in self.context.subscribed_threads:
+            t.join()
+
+    def enter(self, thread_index):
+        self._baton[thread_index].acquire()
+        if self._stopping:
+            raise SimulationStop()
+
+    def leave(self, thread_index):
+        self._runnable.remove(thread_index)
+        self.positions.pop(thread_index, None)
+        self.finished.add(thread_index)
+        self.graph.live.discard(thread_index)
+        self._handover(thread_index, wait=False)
+
+    def crash(self, thread_index, exception):
+        self.exception = (thread_index, exception)
+        self._stop("exception")
+
+    def warn(self, title, message):
+        raise RuntimeError('{}: {}'.format(title, message))
+
+    def thread_index(self):
+        return self.current
+
+    def thread_frames(self):
+        # thread -> its innermost frame (None: not running), e.g. to hash the local state of the threads
+        frames = sys._current_frames()
+        return {t: frames.get(thread.ident) for t, thread in enumerate(self.context.subscribed_threads)}
+
+    def acquired(self, obj):
+        self.graph.acquired(obj, self.current)
+
+    def released(self, obj):
+        self.graph.released(obj, self.current)
+
+    def park(self, obj):
+        thread_index = self.current
+        self._runnable.remove(thread_index)
+        self.blocked[thread_index] = obj
+        self.suspended[thread_index] = obj
+        self._parked.setdefault(obj, []).append(thread_index)
+        self._handover(thread_index)
+        del self.suspended[thread_index]
+
+    def unpark(self, obj):
+        waiters = self._parked.pop(obj, None)
+        if waiters:
+            for thread_index in waiters:
+                del self.blocked[thread_index]
+            self._runnable.extend(waiters)
+
+    def step(self, line_nbr):
+        self.positions[self.current] = line_nbr
+        self._handover(self.current)
+
+    def sleep(self, seconds):
+        # virtual time: the thread is runnable again when the clock gets to its due time, see _advance_clock()
+        thread_index = self.current
+        self._runnable.remove(thread_index)
+        due = self.now + max(seconds, 0)
+        self.sleeping[thread_index] = due
+        heapq.heappush(self._timers, (due, thread_index))
+        self._handover(thread_index)
+
+    def _advance_clock(self, due=None):
+        # no thread can run (or a sleeping one was picked, see _choose()): jump to the first (that) due time
+        # and wake the threads that are due then
+        self.now = max(self.now, self._timers[0][0] if due is None else due)
+        while self._timers and self._timers[0][0] <= self.now:
+            _, thread_index = heapq.heappop(self._timers)
+            del self.sleeping[thread_index]
+            self._runnable.append(thread_index)
+
+    def _choose(self):
+        if self.steps >= self.max_steps:
+            self._stop("steps")
+            return None
+        runnable = self._runnable
+        if self._timers:
+            # steps take no virtual time, so a sleeping thread may be due before any next step: it can be
+            # picked too, which moves the clock to its due time (a spinning thread can't starve it)
+            runnable = runnable + [t for _, t in sorted(self._timers)]
+        nxt = self.policy.choose(runnable, self.current)
+        if nxt is None:
+            self._stop("stopped")
+            return None
+        if nxt not in runnable:
+            # e.g. a replayed schedule that no longer fits the DUT: the thread has finished or is blocked
+            self.diverged = (self.steps, nxt, sorted(runnable))
+            self._stop("diverged")
+            return None
+        if nxt in self.sleeping:
+            self._advance_clock(self.sleeping[nxt])
+        self.steps += 1
+        self.schedule.append(nxt)
+        return nxt
+
+    def _handover(self, thread_index, wait=True):
+        # pass the token to the thread the policy picks and (if wait) wait until it comes back
+        if not self._runnable and self._timers:
+            self._advance_clock()
+        if not self._runnable:
+            if self.blocked:
+                # a run only stops at a deadlock once all threads are blocked, so only then is the
+                # wait-for graph searched (for the report), not at every wait
+                self.graph.find_any_cycle()
+            self._stop("deadlock" if self.blocked else "finished")
+            nxt = None
         else:
-            s = functools.reduce(lambda a, b: a + "," + b, self._data)
-        return 'bag  {:20}: {}/{} [ {} ]\n'.format(self._name, self.size(), self._max, s)
+            nxt = self._choose()
+        if nxt is None:
+            if wait:
+                raise SimulationStop()
+            return
+        if nxt == thread_index:
+            return
+        self.current = nxt
+        self._switch(thread_index, nxt, wait)
+
+    def _switch(self, thread_index, nxt, wait):
+        self._baton[nxt].release()
+        if wait:
+            self._baton[thread_index].acquire()
+            if self._stopping:
+                raise SimulationStop()
+
+    def _stop(self, status):
+        # called by the token holder: release all other threads, they unwind with SimulationStop
+        if self._stopping:
+            return
+        self.status = status
+        self._stopping = True
+        for thread_index, baton in self._baton.items():
+            if thread_index != self.current and baton.locked():
+                baton.release()
+        self._done.set()
+
+
+class GreenletScheduler(HeadlessScheduler):
+    """
+    HeadlessScheduler that runs every DUT thread as a greenlet in the calling thread instead of as an OS thread:
+    the same decisions (the same schedule for the same policy) at a fraction of the memory, so thousands of
+    DUT threads can be simulated; needs the greenlet package
+    """
+
+    def __init__(self, context, policy, max_steps):
+        if greenlet is None:
+            raise RuntimeError("the greenlet backend needs the greenlet package (pip install greenlet)")
+        super().__init__(context, policy, max_steps)
+        self._greenlets: Dict[int, Any] = {}
+        self._main = None
+
+    def run(self):
+        # a DUT thread switches to the next one itself; control comes back here when one has finished
+        # or one is to be started (to switch to the thread picked after it) or the run is over
+        main = self._main = greenlet.getcurrent()
+        functions = self.context.subscribed_functions
+        self.graph.live.update(range(self.context.threads_nrof))
+        for index, function in enumerate(functions):
+            self._greenlets[index] = greenlet.greenlet(functools.partial(self.context.thread_wrapper, function, index),
+                                                       parent=main)
+            self._runnable.append(index)
+        with self.context:
+            if self._runnable:
+                try:
+                    self.current = self._choose()
+                except BaseException:
+                    self._stop("exception")
+                    raise
+                while not self._stopping:
+                    self._greenlets[self.current].switch()
+            else:
+                self._stop("finished")
+            # unwind the suspended threads: they see _stopping and raise SimulationStop
+            for g in self._greenlets.values():
+                if g:
+                    g.switch()
+        self._greenlets.clear()
+
+    def enter(self, thread_index):
+        if self._stopping:
+            raise SimulationStop()
+
+    def thread_index(self):
+        return self.current
+
+    def thread_frames(self):
+        # a suspended greenlet keeps its frame in gr_frame, the running one is the caller's
+        return {t: sys._getframe(1) if t == self.current else g.gr_frame for t, g in self._greenlets.items()}
+
+    def _switch(self, thread_index, nxt, wait):
+        # not wait: thread_index has finished, its greenlet returns to run()
+        if wait:
+            g = self._greenlets[nxt]
+            # a greenlet that is not started yet is started by run(): one started from another greenlet
+            # would start at its recursion depth
+            (g if g else self._main).switch()
+            if self._stopping:
+                raise SimulationStop()
+
+    def _stop(self, status):
+        if not self._stopping:
+            self.status = status
+            self._stopping = True
+
+
+# the schedulers run_headless() can run the DUT threads with (SimulationContext.backend)
+BACKENDS = {"threads": HeadlessScheduler, "greenlets": GreenletScheduler}
+
+
+class HeadlessResult(object):
+    """ outcome of run_headless() """
+
+    def __init__(self, scheduler, seconds):
+        self.status = scheduler.status          # finished, steps, deadlock, exception, stopped or diverged
+        self.steps = scheduler.steps
+        self.seconds = seconds
+        self.virtual_seconds = scheduler.now
+        self.schedule = scheduler.schedule
+        self.positions = scheduler.positions
+        self.blocked = scheduler.blocked
+        self.exception = scheduler.exception
+        self.diverged = scheduler.diverged
+        self.deadlock = (scheduler.graph.describe(scheduler.positions, scheduler.context.dut_file)
+                         if scheduler.status == "deadlock" else None)
+
+    def steps_per_second(self):
+        return self.steps / self.seconds if self.seconds else 0.0
 
+    def __str__(self):
+        s = '{}: {} steps in {:.3f}s ({:.0f} steps/s)'.format(self.status, self.steps, self.seconds,
+                                                              self.steps_per_second())
+        if self.virtual_seconds:
+            s += ', {:.3f}s of virtual time'.format(self.virtual_seconds)
+        if self.exception is not None:
+            s += '\n  thread {}: {!r}'.format(*self.exception)
+        if self.diverged is not None:
+            s += '\n  step {}: thread {} cannot run (runnable: {})'.format(*self.diverged)
+        if self.deadlock is not None:
+            s += '\n' + self.deadlock
+        return s
+
+
+class SimulationContext(object):
+    """
+    the state of one simulation: the DUT objects and threads, the breakpoint slots, the scheduler and the hooks;
+    independent simulations (e.g. in threads of their own) each have their own context:
+        with SimulationContext() as context:
+            context.load_dut("Dut_Example")
+            result = context.run_headless(RandomPolicy(1))
+    A My* object is bound to the context that is active when it is created (current_context()), a DUT thread
+    runs in the context it was subscribed in. The module-level functions and names (env.load_dut(),
+    env.scheduler, ...) are those of the active context.
+    """
+
+    def __init__(self):
+        self.thread_blockable: Dict[int, bool] = {}
+        self.thread_wake: Dict[int, threading.Event] = {}   # per thread: set to let a parked thread re-check its state
+        self.thread_index_list: Dict[int, int] = {}         # thread id -> thread index
+        self.threads_nrof = 0
+        self.lines_nrof = 0
+        self.subscribed_functions: List[Callable[[], None]] = []
+        self.subscribed_threads: List[threading.Thread] = []    # made when the threads are started
+        self.subscribed_objects: List[Any] = []
+        # (code object, line number) -> breakpoint slot (the DUT line number; 0: not a breakpoint, skip it)
+        self.breakpoint_slots: Dict[Tuple[CodeType, int], int] = {}
+        self.dut_file = "?"
+        # what DUT threads read instead of the Tk variables of the gui (Tcl must only be called from the gui
+        # thread): written by the gui thread only, see Gui.publish_settings/publish_breakpoint
+        self.block_all = True
+        self.run_speed = 0
+        self.breakpoint_lines: Dict[int, bytearray] = {}    # per thread: a byte per DUT line, 1: breakpoint
+        self.gui = None
+        # called as access_hook(obj, write) on every operation on a DUT object (e.g. by the Explorer); None: off
+        self.access_hook = None
+        # called as trace_hook(obj, operation, value before, value after) when an operation on a DUT object has
+        # been done (e.g. by a Trace.TraceRecorder); None: off
+        self.trace_hook = None
+        # collects wait latency, hold time, queue depth and operation counts per object (a Metrics.Metrics);
+        # None: off
+        self.metrics = None
+        # orders the operations by vector clocks and reports the data races (a Races.RaceDetector); None: off
+        self.races = None
+        self.scheduler = GuiScheduler(self)
+        self.quiet = False      # drop what the DUT threads print, see _quiet()
+        # time.sleep() etc. of the DUTs loaded from now on run on the virtual clock of the scheduler, see _VirtualTime
+        self.virtual_time = False
+        # what run_headless() runs the DUT threads as: OS "threads" or "greenlets", see BACKENDS
+        self.backend = "threads"
+        self._outer = []
+
+    def __enter__(self):
+        self._outer.append(getattr(_active, "context", None))
+        _active.context = self
+        return self
+
+    def __exit__(self, *exc):
+        _active.context = self._outer.pop()
+
+    def thread_wrapper(self, function, index):
+        # the thread runs in this context; register its thread-id (not available when the thread is created;
+        # only when the thread is started) with the index it got when it was subscribed
+        _active.context = self
+        self.thread_index_list[threading.get_ident()] = index
+        print("thread:", threading.get_ident(), index)
+        # do the actual work:
+        try:
+            self.scheduler.enter(index)
+            function()
+        except SimulationStop:
+            return
+        except Exception as e:
+            self.scheduler.crash(index, e)
+            return
+        self.scheduler.leave(index)
+
+    def subscribe_thread(self, function):
+        self.subscribed_functions.append(function)
+        self.threads_nrof += 1
+
+    def create_threads(self):
+        # an OS thread per subscribed function that has none yet, for the schedulers that run them as threads
+        for index in range(len(self.subscribed_threads), self.threads_nrof):
+            self.subscribed_threads.append(threading.Thread(target=self.thread_wrapper,
+                                                            args=(self.subscribed_functions[index], index)))
+
+    def blk(self, caller):
+        line_nbr = self.breakpoint_slots.get(caller)
+        if line_nbr is None:
+            line_nbr = self._resolve_slot(caller)
+        if not line_nbr:
+            # _blk()-call comes from Environment.py: to be skipped!
+            return
+        self.scheduler.step(line_nbr)
+
+    def build_breakpoint_slots(self, module):
+        """ precompute the breakpoint slot of every line of the DUT, once, when the DUT is loaded """
+        self.dut_file = pathlib.Path(module.__file__).name
+        codes = []
+        for value in vars(module).values():
+            if isinstance(value, type) and value.__module__ == module.__name__:
+                codes.extend(v.__code__ for v in vars(value).values() if hasattr(v, "__code__"))
+            elif hasattr(value, "__code__") and value.__module__ == module.__name__:
+                codes.append(value.__code__)
+        for code in codes:
+            for nested in _code_objects(code):
+                for _, _, line_nbr in nested.co_lines():
+                    if line_nbr is not None:
+                        self.breakpoint_slots[(nested, line_nbr)] = line_nbr
+
+    def _resolve_slot(self, caller):
+        # slow path for code that was not known when the DUT was loaded; done once per (code, line)
+        code, line_nbr = caller
+        # _blk()-calls coming from Environment.py are to be skipped
+        slot = 0 if code.co_filename == __file__ else line_nbr
+        self.breakpoint_slots[caller] = slot
+        return slot
+
+    def run_headless(self, policy=None, max_steps=100000, quiet=False):
+        """
+        run the subscribed DUT threads without gui under a token-passing scheduler, until all threads
+        are finished or blocked, an exception is raised, or max_steps scheduling decisions are made
+        """
+        if policy is None:
+            policy = RandomPolicy()
+        if self.backend not in BACKENDS:
+            raise ValueError("unknown backend '{}', use one of {}".format(self.backend, ", ".join(BACKENDS)))
+        self.scheduler = BACKENDS[self.backend](self, policy, max_steps)
+        start = time.perf_counter()
+        with _quiet(self) if quiet else contextlib.nullcontext():
+            self.scheduler.run()
+        return HeadlessResult(self.scheduler, time.perf_counter() - start)
+
+    def reset(self):
+        """ forget the current DUT: its objects, threads and breakpoint slots """
+        for registry in (self.thread_blockable, self.thread_wake, self.breakpoint_lines, self.thread_index_list,
+                         self.subscribed_functions, self.subscribed_threads, self.subscribed_objects,
+                         self.breakpoint_slots):
+            registry.clear()
+        self.threads_nrof = 0
+        self.scheduler = GuiScheduler(self)
+
+    def load_dut(self, name, **overrides):
+        """
+        import a DUT module with fresh objects in this context, apply overrides to its module globals (e.g. N=1)
+        and subscribe its threads; the module is private to the context (it is not put in sys.modules), so
+        contexts can load the same DUT at the same time
+        """
+        self.reset()
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError("No module named '{}'".format(name), name=name)
+        dut = importlib.util.module_from_spec(spec)
+        with self:
+            spec.loader.exec_module(dut)
+            if self.virtual_time:
+                _VirtualTime(self).patch(dut)
+            for key, value in overrides.items():
+                setattr(dut, key, value)
+            dut.setup()
+        self.build_breakpoint_slots(dut)
+        return dut
+
+    def run_threads(self):
+        self.scheduler.start()
+
+    def get_thread_index(self):
+        return self.thread_index_list[threading.get_ident()]
+
+    def thread_is_blockable(self, thread_index):
+        return self.thread_blockable[thread_index]
+
+    def thread_set_blockable(self, thread_index):
+        self.thread_blockable[thread_index] = True
+
+    def thread_clear_blockable(self, thread_index):
+        self.thread_blockable[thread_index] = False
+        self.thread_wake[thread_index].set()
+
+    def wake_all_threads(self):
+        # something the parked threads depend on has changed (blocking mode, breakpoints, speed)
+        for wake in self.thread_wake.values():
+            wake.set()
+
+    def auto_run_delay(self):
+        # same average delay as the former busy-loop: 1/3 chance to escape after each sleep of
+        # random() / 2**speed seconds
+        return random.random() * 3 / (pow(2, self.run_speed))
+
+    def is_breakpoint(self, thread_index, line_nbr):
+        lines = self.breakpoint_lines[thread_index]
+        return line_nbr < len(lines) and lines[line_nbr]
+
+
+_default_context = SimulationContext()
+
+
+class _VirtualTime(object):
+    """
+    the time module as seen by a DUT in virtual time: sleep() advances the clock of the scheduler instead of
+    taking wall time, the clocks read it; everything else is the real time module
+    """
+
+    def __init__(self, context):
+        self._context = context
+        self._epoch = time.time()   # time() at virtual time 0
+
+    def patch(self, module):
+        # replace 'import time' and 'from time import sleep, ...' in the module
+        for key, value in list(vars(module).items()):
+            if value is time:
+                setattr(module, key, self)
+            elif callable(value) and getattr(time, getattr(value, "__name__", ""), None) is value and \
+                    hasattr(type(self), value.__name__):
+                setattr(module, key, getattr(self, value.__name__))
+
+    def sleep(self, seconds):
+        self._context.scheduler.sleep(seconds)
+
+    def monotonic(self):
+        return self._context.scheduler.now
+
+    perf_counter = monotonic
+
+    def monotonic_ns(self):
+        return int(self._context.scheduler.now * 1e9)
+
+    perf_counter_ns = monotonic_ns
+
+    def time(self):
+        return self._epoch + self._context.scheduler.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
 
-# local statics for thread_wrapper
-thread_index_counter = 0
-thread_index_mutex = threading.Lock()
 
+class _ContextStdout(object):
+    """ sys.stdout during quiet runs: what is printed in a quiet context is dropped, the rest goes through """
 
-def thread_wrapper(function):
-    global thread_index_counter, thread_index_mutex
-    # get its thread-id (not available when the thread is created; only when the thread is started)
-    # and then get the (next available) index
-    thread_id = threading.get_ident()
-    thread_index_mutex.acquire()
-    index = thread_index_counter
-    thread_index_list[thread_id] = thread_index_counter
-    thread_index_counter += 1
-    print("thread:", threading.get_ident(), index)
-    thread_index_mutex.release()
-    # do the actual work:
-    function()
+    def __init__(self, stream):
+        self.stream = stream
+        self.quiet_runs = 0
 
+    def write(self, text):
+        if current_context().quiet:
+            return len(text)
+        return self.stream.write(text)
 
-def subscribe_thread(function):
-    global threads_nrof
-    t = threading.Thread(target=lambda: thread_wrapper(function))
-    subscribed_threads.append(t)
-    threads_nrof += 1
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 
-gim = threading.Lock()
+_stdout_lock = threading.Lock()
 
 
-def _blk(file_line=None):
-    global subscribed_objects
-    if file_line is None:
-        file_line = getCallerInfo()
-    file_name = file_line[0]
-    line_nbr = file_line[1]
-    if "Environment" in file_name:
-        # _blk()-call comes from Environment.py: to be skipped!
-        return
-    thread_index = get_thread_index()
-
-    gui.show_subscriptions(subscribed_objects)
-    gui.buttonActivate(thread_index, line_nbr)
-    # print(">> brk:", thread_index, line_nbr, thread_is_blockable(thread_index))
-    while thread_is_blockable(thread_index):
-        wait_during_block()
-        # only jump out of the busy-waiting loop when:
-        # - not in blocking mode
-        # - not trapped in a breakpoint
-        # - random change of 33%
-        if not block_step.get() and random.randint(1, 3) == 1 and not is_breakpoint(thread_index, line_nbr):
-            break
-    # print("<< brk:", thread_index, line_nbr, thread_is_blockable(thread_index))
-    gui.show_subscriptions(subscribed_objects)
-    gui.buttonDeactivate(thread_index, line_nbr)
-    thread_set_blockable(thread_index)
+@contextlib.contextmanager
+def _quiet(context):
+    # not contextlib.redirect_stdout(): sys.stdout is shared by all contexts, which may run at the same time
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ContextStdout):
+            sys.stdout = _ContextStdout(sys.stdout)
+        stdout = sys.stdout
+        stdout.quiet_runs += 1
+    context.quiet = True
+    try:
+        yield
+    finally:
+        context.quiet = False
+        with _stdout_lock:
+            stdout.quiet_runs -= 1
+            if stdout.quiet_runs == 0 and sys.stdout is stdout:
+                sys.stdout = stdout.stream
 
 
-def run_threads():
-    for t in subscribed_threads:
-        t.start()
+def current_context():
+    """ the SimulationContext of the calling thread: the innermost one entered, else the default one """
+    return getattr(_active, "context", None) or _default_context
+
+
+def __getattr__(name):
+    # env.scheduler, env.subscribed_objects, ...: the state of the active context
+    if name.startswith("__") or not hasattr(_default_context, name):
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    return getattr(current_context(), name)
+
+
+def subscribe_thread(function):
+    current_context().subscribe_thread(function)
 
 
-def get_thread_index():
-    global thread_index_list
-    thread_id = threading.get_ident()
-    return thread_index_list[thread_id]
+def build_breakpoint_slots(module):
+    current_context().build_breakpoint_slots(module)
 
 
-def thread_is_blockable(thread_index):
-    return thread_blockable[thread_index]
+def run_headless(policy=None, max_steps=100000, quiet=False):
+    return current_context().run_headless(policy, max_steps, quiet)
 
 
-def thread_set_blockable(thread_index):
-    thread_blockable[thread_index] = True
+def reset():
+    current_context().reset()
 
 
-def thread_clear_blockable(thread_index):
-    thread_blockable[thread_index] = False
+def load_dut(name, **overrides):
+    return current_context().load_dut(name, **overrides)
 
 
-def wait_during_block():
-    global speed
-    time.sleep(random.random() / (pow(2, speed.get())))
+def parse_overrides(args):
+    """ NAME=value command line arguments as load_dut() overrides; the values are Python literals """
+    overrides = {}
+    for arg in args:
+        key, value = arg.split("=", 1)
+        overrides[key] = ast.literal_eval(value)
+    return overrides
 
 
-def is_breakpoint(thread_index, line_nbr):
-    return breakpoints_threads[thread_index][line_nbr].get()
+def check_invariant(invariant):
+    """ call the invariant() of a DUT: (ok, detail); an AssertionError is a violation too """
+    try:
+        ok = invariant()
+    except AssertionError as e:
+        return False, "invariant() raised {!r}".format(e)
+    return ok, "invariant() returned {!r}".format(ok)
+
+
+def run_threads():
+    current_context().run_threads()
 
 
 class Gui:
+    frame_rate = 25     # max number of gui updates per second
+    cell = 14           # size in pixels of a cell of the breakpoint grid
+    gap = 4             # between the "all threads" column and the thread columns
+    grid_columns = 32   # max number of thread columns in view, more can be scrolled to
 
-    def __init__(self, filename):
-        global threads_nrof, lines_nrof
+    def __init__(self, filename, context=None):
         # print("Gui()", threading.get_ident())
-        global block_step, speed
+        self.context = context or current_context()
+        self.context.gui = self
 
         self.root = tk.Tk()
 
-        block_step = tk.IntVar(value=1)     # initially: on
-        speed = tk.IntVar()                 # initially: slow
+        self.block_step = tk.IntVar(value=1)    # initially: on
+        self.speed = tk.IntVar()                # initially: slow
 
         self.root.title("Sync Simulator")
         self.root.rowconfigure(0, minsize=900, weight=1)
@@ -385,140 +1604,283 @@ class Gui:
         self.frm_blocking = tk.Frame(self.root, relief=tk.RAISED, bd=1)
 
         btn_quit = tk.Button(self.frm_control, text="Quit", command=self.root.quit)
-        btn_run = tk.Button(self.frm_control, text="Run", command=run_threads)
+        btn_run = tk.Button(self.frm_control, text="Run", command=self.context.run_threads)
 
-        cb_block_step = tk.Checkbutton(self.frm_control, text='block at _blk()', variable=block_step,
-                                       onvalue=1, offvalue=0)
+        cb_block_step = tk.Checkbutton(self.frm_control, text='block at _blk()', variable=self.block_step,
+                                       onvalue=1, offvalue=0, command=self.publish_settings)
 
-        sld_speed = tk.Scale(self.frm_control, variable=speed, from_=0, to=8, orient=tk.HORIZONTAL)
-        # width is used to make enough room for the check-boxes
-        lbl = tk.Label(self.frm_blocking, text="   ", height=0, width=threads_nrof * 2 + 4)
-
-        self.pixelVirtual = tk.PhotoImage(width=1, height=1)
+        sld_speed = tk.Scale(self.frm_control, variable=self.speed, from_=0, to=8, orient=tk.HORIZONTAL,
+                             command=lambda _: self.publish_settings())
 
         btn_quit.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
         btn_run.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
         cb_block_step.grid(row=2, column=0, sticky="ew")
         sld_speed.grid(row=3, column=0, sticky="ew")
 
-        lbl.grid(row=0, column=0, sticky="sew", padx=2 * threads_nrof + 2)
-
         self.frm_control.grid(row=0, column=0, sticky="ns")
         self.frm_blocking.grid(row=0, column=1, sticky="ns")
         self.txt_source.grid(row=0, column=2, sticky="nsew")
         self.txt_variables.grid(row=0, column=3, sticky="nsew")
 
         self.txt_variables.insert(tk.END, "variables will be listed here")
-        self.mutex_print = threading.Lock()
+        # contention metrics (see Metrics.py) next to the variables, refreshed once per second
+        self.txt_metrics = None
+        self.frames = 0
+        if self.context.metrics is not None:
+            self.txt_metrics = tk.Text(self.root, font="TkFixedFont", wrap=tk.NONE)
+            self.txt_metrics.grid(row=0, column=4, sticky="nsew")
+        # Tk is not thread-safe: DUT threads only post events, render() handles them on the Tk thread
+        self.events = queue.SimpleQueue()
+        self.rendered = []      # per line of txt_variables: [object, its version when rendered]
 
-        self.btn_block_thread = {}
-        self.cb_break_thread_line = {}
-        self.cb_break__general__line = {}
-        self.breakpoints_general_line_IntVar = {}
+        self.context.lines_nrof, self.breakable_line_nbr_list = self.read_file(filename)
 
-        lines_nrof, self.breakable_line_nbr_list = self.read_file(filename)
+        self.create_breakpoint_grid()
 
-        self.create_btn_block_all()
-        self.create_cb_general_all()
-        self.create_cb_breakpoints(threads_nrof, self.breakable_line_nbr_list)
+        self.root.after(1000 // self.frame_rate, self.render)
 
     def read_file(self, filepath=None):
         self.txt_source.delete(1.0, tk.END)
         curr_line_nbr = 0
-        breakable_line_nbr_list = []
+        breakable_line_nbr_list = breakable_lines(filepath)
         with open(filepath, "r") as input_file:
             org_line = input_file.readline()
             while org_line:
                 curr_line_nbr += 1
-                if (
-                        "_blk" in org_line or "wait" in org_line or "signal" in org_line or "notify" in org_line or
-                        "lock" in org_line or "unlock" in org_line
-                ) and "(" in org_line and ")" in org_line:
-                    breakable_line_nbr_list.append(curr_line_nbr)
                 line = '{:2}: '.format(curr_line_nbr)
                 self.txt_source.insert(tk.END, line + org_line)
                 org_line = input_file.readline()
         self.root.title(f"Sync Simulator - {filepath}")
         return curr_line_nbr, breakable_line_nbr_list
 
+    def post(self, *event):
+        # called from any thread
+        self.events.put(event)
+
+    def render(self):
+        # drain the events, at most frame_rate times per second; per thread only its last
+        # activate (and a deactivate after it) still matters
+        self.root.after(1000 // self.frame_rate, self.render)
+        buttons = {}
+        messages = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "activate":
+                buttons[event[1]] = [event]
+            elif event[0] == "deactivate":
+                buttons.setdefault(event[1], []).append(event)
+            else:
+                messages.append(event)
+        for events in buttons.values():
+            for kind, t, n in events:
+                if kind == "activate":
+                    self.buttonActivate(t, n)
+                else:
+                    self.buttonDeactivate(t, n)
+        self.show_subscriptions(self.context.subscribed_objects)
+        self.frames += 1
+        metrics = self.context.metrics
+        if self.txt_metrics is not None and metrics is not None and self.frames % self.frame_rate == 0:
+            self.txt_metrics.delete(1.0, tk.END)
+            self.txt_metrics.insert(tk.END, metrics.report())
+        for message in messages:
+            if message[0] == "deadlock":
+                tk.messagebox.showerror("Deadlock", message[1])
+            else:
+                tk.messagebox.showinfo(message[1], message[2])
+
     def show_subscriptions(self, subscriptions):
-        self.mutex_print.acquire()
-        self.txt_variables.delete(1.0, tk.END)
-        for v in subscriptions:
-            self.txt_variables.insert(tk.END, v)
-        self.mutex_print.release()
+        # re-render only the objects whose version changed (all of them when objects were added)
+        if len(self.rendered) != len(subscriptions):
+            self.txt_variables.delete(1.0, tk.END)
+            self.rendered = []
+            for v in subscriptions:
+                self.rendered.append([v, v._version])
+                self.txt_variables.insert(tk.END, v)
+            return
+        for line_nbr, (v, version) in enumerate(self.rendered, 1):
+            if v._version != version:
+                self.rendered[line_nbr - 1][1] = v._version
+                self.txt_variables.replace('{}.0'.format(line_nbr), '{}.end'.format(line_nbr), str(v).rstrip("\n"))
 
     def mainloop(self):
         self.root.mainloop()
 
-    def create_btn_block_all(self):
-        for t in range(threads_nrof):
-            self.create_btn_block_thread(t)
-
-    def create_btn_block_thread(self, t):
-        self.btn_block_thread[t] = tk.Button(self.frm_blocking, text="+",
-                                             command=lambda: self.clickButton_thread(t),
-                                             image=self.pixelVirtual,
-                                             compound="c", height=6, width=6)
-        self.btn_block_thread[t].place(x=3 + 18 * t, y=1)
-        thread_set_blockable(t)
-
-    def create_cb_general_all(self):
-        for n in self.breakable_line_nbr_list:
-            self.create_cb_general(n)
-
-    def create_cb_general(self, n):
-        if not (n in self.breakpoints_general_line_IntVar.keys()):
-            self.breakpoints_general_line_IntVar[n] = tk.IntVar()
-            self.cb_break__general__line[n] = tk.Checkbutton(self.frm_blocking, image=self.pixelVirtual,
-                                                             command=lambda: self.click_cb_general(n),
-                                                             variable=self.breakpoints_general_line_IntVar[n],
-                                                             height=6, width=6, bd=0, padx=0, pady=0)
-            self.cb_break__general__line[n].place(x=18 * threads_nrof + 10, y=16 * n - 16)
-
-    def create_cb_thread_line(self, t, n):
-        # add a breakpoint for a line only once
-        if not (n in breakpoints_threads[t].keys()):
-            breakpoints_threads[t][n] = tk.IntVar()
-            self.cb_break_thread_line[t][n] = tk.Checkbutton(self.frm_blocking, image=self.pixelVirtual,
-                                                             variable=breakpoints_threads[t][n],
-                                                             height=6, width=6, bd=0, padx=0, pady=0)
-            self.cb_break_thread_line[t][n].place(x=18 * t, y=16 * n - 16)
-
-    def create_cb_breakpoints(self, t_nrof, breakable_line_nbr_list):
-        for t in range(t_nrof):
-            self.cb_break_thread_line[t] = {}
-            breakpoints_threads[t] = {}
-            for n in breakable_line_nbr_list:
-                self.create_cb_thread_line(t, n)
+    def create_breakpoint_grid(self):
+        # one Canvas for the thread x line grid (plus the "all threads" column) and one for the thread
+        # buttons above it; only the cells in view are drawn, see draw_grid()
+        self.columns = max(1, min(self.context.threads_nrof, self.grid_columns))    # thread columns in view
+        width = (self.columns + 1) * self.cell + self.gap
+        self.cnv_threads = tk.Canvas(self.frm_blocking, width=width, height=self.cell + 2, highlightthickness=0)
+        self.cnv_breakpoints = tk.Canvas(self.frm_blocking, width=width, highlightthickness=0, bg="white")
+        self.scb_threads = tk.Scrollbar(self.frm_blocking, orient=tk.HORIZONTAL, command=self.scroll_threads)
+        self.cnv_threads.grid(row=0, column=0, sticky="ew")
+        self.cnv_breakpoints.grid(row=1, column=0, sticky="ns")
+        self.frm_blocking.rowconfigure(1, weight=1)
+        if self.context.threads_nrof > self.columns:
+            self.scb_threads.grid(row=2, column=0, sticky="ew")
+
+        self.first_thread = 0       # leftmost thread column in view
+        self.general = set()        # lines with a breakpoint for all threads
+        self.thread_line = {}       # thread -> (line, color): where it stopped (red) or last went on from (yellow)
+        self.thread_active = {}     # thread -> stopped at _blk() ("+"), else running ("o")
+        self.cells = {}             # (thread or None, line) -> canvas items of a cell in view
+        self.rows = {}              # line in view -> y of its cells
+        self.headers = {}           # thread in view -> its canvas items above the grid
+        for t in range(self.context.threads_nrof):
+            self.context.breakpoint_lines[t] = bytearray(self.context.lines_nrof + 1)
+            self.context.thread_wake.setdefault(t, threading.Event())
+            self.context.thread_set_blockable(t)
+
+        self.cnv_breakpoints.bind("<Button-1>", self.click_grid)
+        self.cnv_breakpoints.bind("<Configure>", lambda _: self.draw_grid())
+        self.cnv_threads.bind("<Button-1>", self.click_threads)
+        self.txt_source.configure(yscrollcommand=lambda *_: self.draw_grid())
+        self.scroll_threads("moveto", 0)
+
+    def draw_grid(self):
+        # (re)draw the cells of the breakable lines in view in txt_source, for the thread columns in view
+        self.cnv_breakpoints.delete("all")
+        self.cells = {}
+        self.rows = {}
+        if self.context.threads_nrof == 0:
+            return      # no thread columns: the one column in view (see create_breakpoint_grid) stays empty
+        offset = self.txt_source.winfo_rooty() - self.cnv_breakpoints.winfo_rooty()
+        first = int(self.txt_source.index("@0,0").split(".")[0])
+        last = int(self.txt_source.index("@0,{}".format(self.txt_source.winfo_height())).split(".")[0])
+        lines = self.breakable_line_nbr_list
+        for n in lines[bisect.bisect_left(lines, first):bisect.bisect_right(lines, last)]:
+            info = self.txt_source.dlineinfo('{}.0'.format(n))
+            if info is None:
+                continue
+            self.rows[n] = offset + info[1] + (info[3] - self.cell) // 2
+            self.draw_cell(None, n)
+            for t in range(self.first_thread, self.first_thread + self.columns):
+                self.draw_cell(t, n)
+        self.draw_threads()
+
+    def cell_x(self, t):
+        # None: the "all threads" column
+        return 0 if t is None else (t - self.first_thread + 1) * self.cell + self.gap
+
+    def draw_cell(self, t, n):
+        y = self.rows.get(n)
+        if y is None or (t is not None and not self.first_thread <= t < self.first_thread + self.columns):
+            return      # not in view
+        for item in self.cells.pop((t, n), ()):
+            self.cnv_breakpoints.delete(item)
+        x = self.cell_x(t)
+        if t is None:
+            fill, is_breakpoint = "lightgrey", n in self.general
+        else:
+            line, color = self.thread_line.get(t, (None, None))
+            fill, is_breakpoint = color if line == n else "white", self.context.breakpoint_lines[t][n]
+        items = [self.cnv_breakpoints.create_rectangle(x, y, x + self.cell - 2, y + self.cell - 2, fill=fill,
+                                                       outline="grey")]
+        if is_breakpoint:
+            items.append(self.cnv_breakpoints.create_rectangle(x + 3, y + 3, x + self.cell - 5, y + self.cell - 5,
+                                                               fill="black", outline=""))
+        self.cells[(t, n)] = items
+
+    def draw_threads(self):
+        self.cnv_threads.delete("all")
+        self.headers = {}
+        for t in range(self.first_thread, min(self.first_thread + self.columns, self.context.threads_nrof)):
+            x = self.cell_x(t)
+            rectangle = self.cnv_threads.create_rectangle(x, 1, x + self.cell - 2, self.cell - 1, outline="grey")
+            self.headers[t] = (rectangle, self.cnv_threads.create_text(x + (self.cell - 2) // 2, self.cell // 2))
+            self.draw_thread(t)
+
+    def draw_thread(self, t):
+        if t in self.headers:
+            active = self.thread_active.get(t, False)
+            rectangle, text = self.headers[t]
+            self.cnv_threads.itemconfigure(rectangle, fill="lightgreen" if active else "lightgrey")
+            self.cnv_threads.itemconfigure(text, text="+" if active else "o")
+
+    def scroll_threads(self, *args):
+        # Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            first = round(float(args[1]) * self.context.threads_nrof)
+        else:
+            first = self.first_thread + int(args[1]) * (self.columns if args[2] == "pages" else 1)
+        self.first_thread = max(0, min(first, self.context.threads_nrof - self.columns))
+        if self.context.threads_nrof:
+            self.scb_threads.set(self.first_thread / self.context.threads_nrof, (self.first_thread + self.columns) / self.context.threads_nrof)
+        self.draw_grid()
+
+    def column_at(self, x):
+        # the thread of column x, None for the "all threads" column, -1: none
+        if x < self.cell:
+            return None
+        t = self.first_thread + int((x - self.gap) // self.cell) - 1
+        return t if self.first_thread <= t < min(self.first_thread + self.columns, self.context.threads_nrof) else -1
+
+    def click_grid(self, event):
+        t = self.column_at(event.x)
+        for n, y in self.rows.items():
+            if y <= event.y < y + self.cell and t != -1:
+                if t is None:
+                    self.click_cb_general(n)
+                else:
+                    self.publish_breakpoint(t, n, not self.context.breakpoint_lines[t][n])
+                    self.draw_cell(t, n)
+                break
+
+    def click_threads(self, event):
+        t = self.column_at(event.x)
+        if t is not None and t != -1 and self.thread_active.get(t, False):
+            self.clickButton_thread(t)
 
     def clickButton_thread(self, t):
         # print("cbt", threading.get_ident(), t)
-        thread_clear_blockable(t)
+        self.context.thread_clear_blockable(t)
 
     def click_cb_general(self, n):
         # print("cbt", threading.get_ident(), n)
-        for i in range(threads_nrof):
-            breakpoints_threads[i][n].set(self.breakpoints_general_line_IntVar[n].get())
+        value = n not in self.general
+        self.general.symmetric_difference_update({n})
+        for i in range(self.context.threads_nrof):
+            self.publish_breakpoint(i, n, value)
+            self.draw_cell(i, n)
+        self.draw_cell(None, n)
+
+    def publish_settings(self):
+        self.context.block_all = bool(self.block_step.get())
+        self.context.run_speed = self.speed.get()
+        self.context.wake_all_threads()
+
+    def publish_breakpoint(self, t, n, value):
+        # copy-on-write: a DUT thread sees either the old or the new array, never a half-updated one
+        lines = bytearray(self.context.breakpoint_lines[t])
+        lines[n] = value
+        self.context.breakpoint_lines[t] = lines
+        self.context.thread_wake[t].set()
 
     def buttonActivate(self, t, n):
-        for z in self.cb_break_thread_line[t].keys():
-            self.cb_break_thread_line[t][z].configure(bg="white", selectcolor="white")
-
-        self.btn_block_thread[t]["state"] = "active"
-        self.btn_block_thread[t]["text"] = "+"
-        self.cb_break_thread_line[t][n].configure(bg="white", selectcolor="red")
+        self.move_thread(t, n, "red", True)
 
     def buttonDeactivate(self, t, n):
-        self.btn_block_thread[t]["state"] = "disabled"
-        self.btn_block_thread[t]["text"] = "o"
-        self.cb_break_thread_line[t][n].configure(bg="white", selectcolor="yellow")
+        self.move_thread(t, n, "yellow", False)
+
+    def move_thread(self, t, n, color, active):
+        # redraw only the cells that change: the line the thread was marked at and the one it is marked at now
+        old = self.thread_line.get(t)
+        self.thread_line[t] = (n, color)
+        if old is not None and old[0] != n:
+            self.draw_cell(t, old[0])
+        self.draw_cell(t, n)
+        if self.thread_active.get(t) != active:
+            self.thread_active[t] = active
+            self.draw_thread(t)
 
 
 def GuiCreate(filename):
-    global gui
-    gui = Gui(filename)
+    Gui(filename)
 
 
 def GuiMainloop():
-    gui.mainloop()
+    current_context().gui.mainloop()
@@ -0,0 +1,335 @@
+"""
+Exhaustive interleaving explorer (model checker) for a DUT.
+
+The DUT is run headless over and over; every decision of the token-passing scheduler (at _blk(), when a
+thread blocks and when it finishes) is a choice point. The choices are enumerated depth-first:
+- a state (snapshot() of all subscribed objects plus the position and the DUT frames, with their line and
+  locals, of every thread) that was explored before is not explored again
+- partial-order reduction with sleep sets: two transitions that touch no common object (or only read it)
+  are independent, so only one of their two orders is explored
+
+Only the My* objects are regarded as shared state; plain module globals of the DUT are not hashed, nor is
+what a thread keeps outside its locals (e.g. the iterator of a for loop): two states that differ only there
+are taken for the same one. So "no violation" means none was found, it is no proof.
+A DUT may define invariant(), which is checked in every new state.
+
+usage: python Explorer.py <dut> [NAME=value ...]
+e.g.   python Explorer.py Dut64_ModusHall_CondVar_Error N=1
+"""
+import sys
+import time
+
+import Environment as env
+
+
+_WRAPPER = env.SimulationContext.thread_wrapper.__code__
+_PLAIN = (int, float, complex, str, bytes, bool, type(None))
+
+
+def _value(v, index, depth=3):
+    # a local by value, so the same state gets the same key in every run (each run loads the DUT anew):
+    # a subscribed object by its index, a container or plain object by its contents; what's left (or nested
+    # too deep) by identity, which never prunes wrongly, it only doesn't prune
+    if isinstance(v, _PLAIN):
+        return v
+    i = index.get(id(v))
+    if i is not None:
+        return "obj", i
+    if depth:
+        if isinstance(v, (tuple, list, set, frozenset)):
+            items = tuple(_value(x, index, depth - 1) for x in v)
+            return type(v).__name__, tuple(sorted(items, key=repr)) if isinstance(v, (set, frozenset)) else items
+        if isinstance(v, dict):
+            return "dict", tuple((_value(k, index, depth - 1), _value(x, index, depth - 1)) for k, x in v.items())
+        if hasattr(v, "__code__"):
+            return "function", v.__qualname__
+        if hasattr(v, "__dict__"):
+            return type(v).__qualname__, _value(vars(v), index, depth - 1)
+    return "id", id(v)
+
+
+def _local_state(frame, index):
+    # the DUT frames of a thread, outermost first: those between thread_wrapper() and its first call into
+    # Environment (a primitive, _blk()); the subscribed objects in their locals by index
+    chain = []
+    while frame is not None and frame.f_code is not _WRAPPER:
+        chain.append(frame)
+        frame = frame.f_back
+    if frame is None:
+        return ()
+    state = []
+    for f in reversed(chain):
+        if f.f_globals is vars(env):
+            break
+        values = tuple(sorted((name, _value(v, index)) for name, v in f.f_locals.items()))
+        state.append((f.f_code.co_name, f.f_lineno, values))
+    return tuple(state)
+
+
+class _Frame(object):
+    """ a choice point on the depth-first stack """
+
+    def __init__(self, state, sleep, todo):
+        self.state = state      # state hash
+        self.sleep = sleep      # thread -> footprint of a transition that need not be explored here
+        self.todo = todo        # threads still to be explored from here
+        self.done = {}          # explored thread -> footprint of its transition
+        self.choice = None      # thread being explored
+
+
+def _independent(footprint_a, footprint_b):
+    # footprint: object index -> written (True) or only read (False)
+    if len(footprint_a) > len(footprint_b):
+        footprint_a, footprint_b = footprint_b, footprint_a
+    for obj, write in footprint_a.items():
+        other = footprint_b.get(obj)
+        if other is not None and (write or other):
+            return False
+    return True
+
+
+def _mask(threads):
+    mask = 0
+    for t in threads:
+        mask |= 1 << t
+    return mask
+
+
+class _ExplorerPolicy(object):
+    """ the scheduler policy of one run: replays the stack, then extends it depth-first """
+
+    def __init__(self, explorer, dut):
+        self.explorer = explorer
+        self.invariant = getattr(dut, "invariant", None)
+        self.depth = 0
+        self.footprint = {}
+        self._index = {}
+        # the stack is replayed up to the backtrack point, only from there on footprints are recorded
+        self.backtrack = len(explorer.stack) - 1
+
+    def access(self, obj, write):
+        index = self._index.get(id(obj))
+        if index is None:
+            self._index = {id(o): i for i, o in enumerate(self.explorer.context.subscribed_objects)}
+            index = self._index[id(obj)]
+        if write or index not in self.footprint:
+            self.footprint[index] = write
+
+    def close(self):
+        # the transition chosen last has ended: record its footprint
+        stack = self.explorer.stack
+        if 0 < self.depth <= len(stack) and self.depth > self.backtrack:
+            frame = stack[self.depth - 1]
+            frame.done[frame.choice] = self.footprint
+        footprint, self.footprint = self.footprint, {}
+        return footprint
+
+    def choose(self, runnable, current):
+        explorer = self.explorer
+        stack = explorer.stack
+        footprint = self.close()
+        explorer.transitions += 1
+        if self.depth < self.backtrack:
+            # replay
+            frame = stack[self.depth]
+        elif self.depth == self.backtrack:
+            # backtrack point: next alternative; from here on footprints are needed
+            frame = stack[self.depth]
+            frame.choice = frame.todo.pop(0)
+            explorer.context.access_hook = self.access
+        else:
+            frame = self._expand(sorted(runnable), current, footprint)
+            if frame is None:
+                return None
+        self.depth += 1
+        return frame.choice
+
+    def _expand(self, runnable, current, footprint):
+        explorer = self.explorer
+        stack = explorer.stack
+        sleep = {}
+        if stack:
+            parent = stack[-1]
+            for sleeping in (parent.sleep, parent.done):
+                for t, fp in sleeping.items():
+                    if t != parent.choice and t in runnable and _independent(fp, footprint):
+                        sleep[t] = fp
+        state = explorer.state_hash()
+        sleep_mask = _mask(sleep)
+        # the current thread first: the first path then has the fewest context switches to replay
+        todo = [t for t in runnable if t not in sleep and t != current]
+        if current in runnable and current not in sleep:
+            todo.insert(0, current)
+        # a state at max depth is not expanded, so it is not recorded as explored either:
+        # a shorter path to it must not be pruned
+        cut = len(stack) >= explorer.max_depth
+        explored_with = explorer.visited.get(state)
+        if explored_with is not None:
+            # explored before: only what was asleep then (and is awake now) is left to do
+            if explored_with & ~sleep_mask == 0:
+                explorer.pruned_visited += 1
+                return None
+            todo = [t for t in todo if explored_with >> t & 1]
+            if not cut:
+                explorer.visited[state] = explored_with & sleep_mask
+        else:
+            if not cut:
+                explorer.visited[state] = sleep_mask
+            explorer.states += 1
+            if explorer.states == explorer.max_states:
+                explorer.truncated += 1
+                explorer.stack.clear()
+                return None
+            if self.invariant is not None and not self._check_invariant():
+                return None
+        if not todo:
+            explorer.pruned_sleep += 1
+            return None
+        if cut:
+            explorer.truncated += 1
+            return None
+        frame = _Frame(state, sleep, todo)
+        frame.choice = frame.todo.pop(0)
+        stack.append(frame)
+        explorer.max_depth_reached = max(explorer.max_depth_reached, len(stack))
+        return frame
+
+    def _check_invariant(self):
+        context = self.explorer.context
+        hook, context.access_hook = context.access_hook, None
+        ok, detail = env.check_invariant(self.invariant)
+        context.access_hook = hook
+        if not ok:
+            self.explorer.violation = "invariant"
+            self.explorer.violation_detail = detail
+        return ok
+
+
+class ExplorerReport(object):
+    """ outcome of Explorer.run() """
+
+    def __init__(self, explorer, seconds, result):
+        self.dut = explorer.dut
+        self.violation = explorer.violation             # None, deadlock, exception or invariant
+        self.violation_detail = explorer.violation_detail
+        self.counterexample = result.schedule if explorer.violation else None
+        self.states = explorer.states
+        self.transitions = explorer.transitions
+        self.runs = explorer.runs
+        self.seconds = seconds
+        self.pruned_visited = explorer.pruned_visited
+        self.pruned_sleep = explorer.pruned_sleep
+        self.truncated = explorer.truncated
+        self.max_depth_reached = explorer.max_depth_reached
+        self.visited_bytes = explorer.visited_bytes()
+
+    def states_per_second(self):
+        return self.states / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        if self.violation is None:
+            verdict = "no deadlock, exception or invariant violation found"
+        else:
+            verdict = "{} found".format(self.violation.upper())
+        if self.truncated:
+            # states below the cut-off were not explored: there may be more, and shorter, counterexamples
+            verdict += " (incomplete: search truncated {} times by max depth/states)".format(self.truncated)
+        if self.violation is not None:
+            verdict += ": " + self.violation_detail
+        lines = [
+            '{}: {}'.format(self.dut, verdict),
+            '  states explored   : {}'.format(self.states),
+            '  states per second : {:.0f}'.format(self.states_per_second()),
+            '  visited set       : {:.1f} kB'.format(self.visited_bytes / 1024),
+            '  transitions       : {} in {} runs, {:.2f}s'.format(self.transitions, self.runs, self.seconds),
+            '  pruned            : {} visited, {} by sleep sets'.format(self.pruned_visited, self.pruned_sleep),
+            '  max depth         : {}'.format(self.max_depth_reached),
+        ]
+        if self.counterexample is not None:
+            lines.append('  counterexample    : {} steps, threads {}'.format(len(self.counterexample),
+                                                                          self.counterexample))
+        return "\n".join(lines)
+
+
+class Explorer(object):
+    """ depth-first exploration of all interleavings of a DUT (see the module docstring) """
+
+    def __init__(self, dut, max_depth=10000, max_states=None, **overrides):
+        self.dut = dut
+        self.max_depth = max_depth
+        self.max_states = max_states
+        self.overrides = overrides
+        self.context = env.current_context()    # the simulation the DUT is run in
+        self.stack = []
+        self.visited = {}       # state hash -> bit mask of the threads that were asleep when it was explored
+        self.states = 0
+        self.transitions = 0
+        self.runs = 0
+        self.pruned_visited = 0
+        self.pruned_sleep = 0
+        self.truncated = 0
+        self.max_depth_reached = 0
+        self.violation = None
+        self.violation_detail = None
+
+    def state_hash(self):
+        context = self.context
+        sched = context.scheduler
+        index = {id(o): i for i, o in enumerate(context.subscribed_objects)}
+        frames = sched.thread_frames()
+        threads = []
+        for t in range(context.threads_nrof):
+            obj = sched.suspended.get(t)
+            threads.append((sched.positions.get(t), -1 if obj is None else index[id(obj)],
+                            t in sched.blocked, t in sched.finished, sched.sleeping.get(t),
+                            _local_state(frames.get(t), index)))
+        state = (tuple(o.snapshot() for o in context.subscribed_objects), tuple(threads))
+        try:
+            return hash(state)
+        except TypeError:
+            return hash(repr(state))
+
+    def visited_bytes(self):
+        return (sys.getsizeof(self.visited) + sum(sys.getsizeof(k) for k in self.visited) +
+                sum(sys.getsizeof(v) for v in self.visited.values() if v))
+
+    def run(self):
+        start = time.perf_counter()
+        context = self.context
+        while True:
+            dut = context.load_dut(self.dut, **self.overrides)
+            policy = _ExplorerPolicy(self, dut)
+            context.access_hook = policy.access if len(self.stack) < 2 else None
+            try:
+                result = context.run_headless(policy, max_steps=sys.maxsize, quiet=True)
+            finally:
+                context.access_hook = None
+            policy.close()
+            self.runs += 1
+            if self.violation is None and policy.invariant is not None:
+                # the last transition of a run (a thread finished, all blocked) is not followed by a choice
+                policy._check_invariant()
+            if self.violation is not None:
+                pass
+            elif result.status == "deadlock":
+                self.violation = "deadlock"
+                self.violation_detail = str(result)
+            elif result.status == "exception":
+                self.violation = "exception"
+                self.violation_detail = '{!r} in thread {}'.format(result.exception[1], result.exception[0])
+            if self.violation is not None:
+                break
+            while self.stack and not self.stack[-1].todo:
+                self.stack.pop()
+            if not self.stack:
+                break
+        return ExplorerReport(self, time.perf_counter() - start, result)
+
+
+def explore(dut, max_depth=10000, max_states=None, **overrides):
+    """ explore all interleavings of a DUT, return an ExplorerReport """
+    return Explorer(dut, max_depth, max_states, **overrides).run()
+
+
+if __name__ == '__main__':
+    print(explore(sys.argv[1], **env.parse_overrides(sys.argv[2:])))
@@ -0,0 +1,212 @@
+"""
+Schedule fuzzing: run a DUT headless under random schedules until an invariant fails, a deadlock appears or
+an exception is raised; then shrink the failing schedule to as few context switches as possible.
+
+Shrinking works on blocks: a schedule is a list of (thread, number of steps). Removing blocks (delta
+debugging, ddmin) removes context switches; a block whose thread can't run is skipped, and after the last
+block the running thread keeps running as long as it can. A smaller schedule is kept if it still fails the
+same way (deadlock, the same exception type, or the invariant).
+The shrunk schedule is saved for the replay gui (python Replay.py <file>).
+
+A DUT may define invariant(), which is checked before every step.
+
+usage: python Fuzz.py <dut> [--runs N] [--steps N] [--seed N] [--set NAME=value ...] [--out file]
+"""
+import argparse
+import itertools
+import sys
+import time
+
+import Environment as env
+import Replay
+
+
+def context_switches(schedule):
+    return sum(1 for a, b in zip(schedule, schedule[1:]) if a != b)
+
+
+def to_blocks(schedule):
+    return [(t, len(list(steps))) for t, steps in itertools.groupby(schedule)]
+
+
+class _FuzzPolicy(object):
+    """ checks the invariant before every step (and the run after the last) and then lets the next policy choose """
+
+    def __init__(self, invariant, policy):
+        self.invariant = invariant
+        self.policy = policy
+        self.violation = None
+
+    def check(self):
+        # False (and the violation recorded) when the invariant doesn't hold
+        if self.invariant is not None and self.violation is None:
+            ok, detail = env.check_invariant(self.invariant)
+            if not ok:
+                self.violation = detail
+        return self.violation is None
+
+    def choose(self, runnable, current):
+        if not self.check():
+            return None
+        return self.policy.choose(runnable, current)
+
+
+class BlockPolicy(object):
+    """ runs the threads of a list of (thread, steps) blocks in turn, see the module docstring """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.block = 0
+        self.used = 0
+
+    def choose(self, runnable, current):
+        while self.block < len(self.blocks):
+            t, steps = self.blocks[self.block]
+            if self.used < steps and t in runnable:
+                self.used += 1
+                return t
+            self.block += 1
+            self.used = 0
+        return current if current in runnable else min(runnable)
+
+
+class Failure(object):
+    """ a failing run: what failed and the schedule that made it fail """
+
+    def __init__(self, result, violation):
+        if violation is not None:
+            self.kind, self.detail = "invariant", violation
+        elif result.status == "deadlock":
+            self.kind, self.detail = "deadlock", result.deadlock
+        else:
+            self.kind = "exception " + type(result.exception[1]).__name__
+            self.detail = 'thread {}: {!r}'.format(*result.exception)
+        self.schedule = list(result.schedule)
+
+
+class FuzzReport(object):
+    """ outcome of Fuzzer.run() """
+
+    def __init__(self, fuzzer, failure, seed, original, seconds):
+        self.dut = fuzzer.dut
+        self.runs = fuzzer.runs
+        self.seconds = seconds
+        self.failure = failure
+        self.seed = seed
+        self.original = original        # the schedule as found, before shrinking
+        self.saved = None
+
+    def __str__(self):
+        if self.failure is None:
+            return '{}: no failure in {} runs ({:.1f}s)'.format(self.dut, self.runs, self.seconds)
+        lines = [
+            '{}: {} found with seed {} ({} runs, {:.1f}s)'.format(self.dut, self.failure.kind.upper(), self.seed,
+                                                                   self.runs, self.seconds),
+            '  found    : {} steps, {} context switches'.format(len(self.original), context_switches(self.original)),
+            '  shrunk to: {} steps, {} context switches'.format(len(self.failure.schedule),
+                                                                 context_switches(self.failure.schedule)),
+            '  ' + self.failure.detail.replace("\n", "\n  "),
+        ]
+        if self.saved is not None:
+            lines.append('  saved to : {}'.format(self.saved))
+        return "\n".join(lines)
+
+
+class Fuzzer(object):
+    """ random schedules for a DUT until one fails, then shrinking (see the module docstring) """
+
+    # chances to keep running the current thread: from many to few context switches
+    stays = (0.0, 0.5, 0.9, 0.99)
+
+    def __init__(self, dut, max_steps=10000, **overrides):
+        self.dut = dut
+        self.max_steps = max_steps
+        self.overrides = overrides
+        self.runs = 0
+
+    def run_once(self, policy, max_steps):
+        """ one run; returns a Failure or None """
+        dut = env.load_dut(self.dut, **self.overrides)
+        fuzz_policy = _FuzzPolicy(getattr(dut, "invariant", None), policy)
+        result = env.run_headless(fuzz_policy, max_steps, quiet=True)
+        self.runs += 1
+        # the last transition of a run (a thread finished, all blocked) is not followed by a choice
+        fuzz_policy.check()
+        if fuzz_policy.violation is None and result.status not in ("deadlock", "exception"):
+            return None
+        return Failure(result, fuzz_policy.violation)
+
+    def fuzz(self, seeds):
+        for seed in seeds:
+            failure = self.run_once(env.RandomPolicy(seed, self.stays[seed % len(self.stays)]), self.max_steps)
+            if failure is not None:
+                return seed, failure
+        return None, None
+
+    def shrink(self, failure):
+        """ ddmin over the blocks of the schedule; returns the smallest Failure of the same kind """
+        # a shrunk schedule may need more steps in the tail, after its last block
+        max_steps = max(self.max_steps, 2 * len(failure.schedule))
+        tried = {}
+
+        def fails(blocks):
+            key = tuple(blocks)
+            if key not in tried:
+                tried[key] = self.run_once(BlockPolicy(blocks), max_steps)
+            found = tried[key]
+            return found is not None and found.kind == failure.kind
+
+        blocks = to_blocks(failure.schedule)
+        n = 2
+        while len(blocks) >= 2:
+            chunk = max(1, len(blocks) // n)
+            subsets = [blocks[i:i + chunk] for i in range(0, len(blocks), chunk)]
+            reduced = False
+            for i in range(len(subsets)):
+                # first try a subset alone, then without it
+                for candidate in (subsets[i], [b for j, s in enumerate(subsets) if j != i for b in s]):
+                    if candidate and len(candidate) < len(blocks) and fails(candidate):
+                        blocks = candidate
+                        n = 2 if candidate is subsets[i] else max(n - 1, 2)
+                        reduced = True
+                        break
+                if reduced:
+                    break
+            if not reduced:
+                if n >= len(blocks):
+                    break
+                n = min(n * 2, len(blocks))
+        # blocks is either the original or a candidate that failed the same way
+        return tried.get(tuple(blocks)) or failure
+
+    def run(self, seeds, out=None):
+        start = time.perf_counter()
+        seed, failure = self.fuzz(seeds)
+        original = failure.schedule if failure is not None else None
+        if failure is not None:
+            failure = self.shrink(failure)
+        report = FuzzReport(self, failure, seed, original, time.perf_counter() - start)
+        if failure is not None and out is not None:
+            Replay.save_schedule(out, self.dut, failure.schedule, **self.overrides)
+            report.saved = out
+        return report
+
+
+def fuzz(dut, runs=1000, max_steps=10000, first_seed=0, out=None, **overrides):
+    """ fuzz a DUT with seeds first_seed, first_seed + 1, ...; return a FuzzReport """
+    return Fuzzer(dut, max_steps, **overrides).run(range(first_seed, first_seed + runs), out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="fuzz the schedules of a DUT and shrink a failing one")
+    parser.add_argument("dut")
+    parser.add_argument("--runs", type=int, default=1000, help="number of random schedules to try")
+    parser.add_argument("--steps", type=int, default=10000, help="step budget per run")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--set", nargs="+", default=[], metavar="NAME=value", help="DUT module globals, e.g. N=1")
+    parser.add_argument("--out", default=None, help="file for the shrunk schedule (default: <dut>.fuzz.json)")
+    args = parser.parse_args()
+    overrides = env.parse_overrides(args.set)
+    report = fuzz(args.dut, args.runs, args.steps, args.seed, args.out or args.dut + ".fuzz.json", **overrides)
+    print(report)
+    sys.exit(0 if report.failure is None else 1)
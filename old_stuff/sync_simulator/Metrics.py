@@ -0,0 +1,181 @@
+"""
+Contention metrics of the synchronisation objects of a DUT.
+
+Per MySemaphore, MyMutex, MyLightswitch, MyConditionVariable and MyBarrier:
+- operation counts
+- wait latency: from the start of a (possibly blocking) operation until it got through
+- hold time: from getting through until the same thread releases (signal/unlock) the object
+- queue depth: the number of threads already waiting when a thread starts to wait
+Latencies are measured with perf_counter_ns(); all samples go into fixed-size log2 histograms.
+
+record: with Metrics.measuring() as metrics:
+            env.run_headless(...)
+        print(metrics.report())
+        metrics.export("run.csv")       # or .json
+"""
+import contextlib
+import csv
+import json
+import pathlib
+import time
+
+import Environment as env
+
+
+class Histogram(object):
+    """ log2 histogram of non-negative integers: bucket b counts the values v with v.bit_length() == b """
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+    size = 64
+
+    def __init__(self):
+        self.buckets = [0] * self.size
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[min(value.bit_length(), self.size - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """ upper bound of the bucket that holds the p-th percentile (exact for min and max) """
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(max((1 << bucket) - 1, self.min), self.max)
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "mean": self.mean(), "min": self.min, "max": self.max,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99),
+                "buckets": self.buckets}
+
+
+class ObjectMetrics(object):
+    """ the metrics of one object """
+
+    def __init__(self, obj):
+        self.name = obj._name
+        self.kind = type(obj).__name__
+        self.ops = {}
+        self.wait = Histogram()         # ns
+        self.hold = Histogram()         # ns
+        self.depth = Histogram()        # threads
+        self.waiting = 0
+        self.held = {}                  # thread -> perf_counter_ns() when it got through
+
+
+class Metrics(object):
+    """ collects the metrics of all objects the DUT operates on, see the module docstring """
+
+    # the histograms shown/exported per object: (attribute, unit)
+    histograms = (("wait", "ns"), ("hold", "ns"), ("depth", "threads"))
+
+    def __init__(self):
+        self.context = env.current_context()    # the simulation it measures, see start()
+        self.objects = {}       # id(obj) -> ObjectMetrics, in order of first operation
+        self._refs = []         # keeps the objects (and so their ids) alive
+
+    def start(self, context=None):
+        if context is not None:
+            self.context = context
+        self.context.metrics = self
+
+    def stop(self):
+        if self.context.metrics is self:
+            self.context.metrics = None
+
+    def _of(self, obj):
+        m = self.objects.get(id(obj))
+        if m is None:
+            m = self.objects[id(obj)] = ObjectMetrics(obj)
+            self._refs.append(obj)
+        return m
+
+    # called by the objects, under scheduler.lock
+
+    def count(self, obj, op):
+        m = self._of(obj)
+        m.ops[op] = m.ops.get(op, 0) + 1
+        return m
+
+    def begin(self, obj, op):
+        m = self.count(obj, op)
+        m.depth.add(m.waiting)
+        m.waiting += 1
+        return time.perf_counter_ns()
+
+    def acquired(self, obj, start, hold=True):
+        now = time.perf_counter_ns()
+        m = self._of(obj)
+        m.waiting -= 1
+        m.wait.add(now - start)
+        if hold:
+            m.held[obj._ctx.scheduler.thread_index()] = now
+
+    def released(self, obj, op):
+        m = self.count(obj, op)
+        start = m.held.pop(obj._ctx.scheduler.thread_index(), None)
+        if start is not None:
+            m.hold.add(time.perf_counter_ns() - start)
+
+    # results
+
+    def report(self):
+        lines = ['{:20} {:6} {:>8} {:>10} {:>10} {:>10} {:>10}'.format("object", "metric", "count", "mean",
+                                                                     "p50", "p99", "max")]
+        for m in self.objects.values():
+            ops = ", ".join('{} {}'.format(op, n) for op, n in m.ops.items())
+            lines.append('{:20} {}: {}'.format(m.name, m.kind, ops))
+            for attribute, unit in self.histograms:
+                h = getattr(m, attribute)
+                if h.count:
+                    lines.append('{:20} {:6} {:8} {:10.0f} {:10} {:10} {:10}'.format(
+                        "", attribute, h.count, h.mean(), h.percentile(50), h.percentile(99), h.max))
+        return "\n".join(lines)
+
+    def as_list(self):
+        return [{"name": m.name, "kind": m.kind, "ops": m.ops,
+                 **{attribute: getattr(m, attribute).as_dict() for attribute, _ in self.histograms}}
+                for m in self.objects.values()]
+
+    def export(self, path):
+        """ write the metrics to a .json or .csv file """
+        if pathlib.Path(path).suffix == ".json":
+            with open(path, "w") as f:
+                json.dump(self.as_list(), f, indent=1)
+            return
+        ops = sorted({op for m in self.objects.values() for op in m.ops})
+        stats = ("count", "mean", "min", "max", "p50", "p90", "p99")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "kind"] + ops +
+                            ['{}_{}'.format(attribute, stat) for attribute, _ in self.histograms for stat in stats])
+            for m in self.as_list():
+                writer.writerow([m["name"], m["kind"]] + [m["ops"].get(op, 0) for op in ops] +
+                                [m[attribute][stat] for attribute, _ in self.histograms for stat in stats])
+
+
+@contextlib.contextmanager
+def measuring():
+    """ collect the metrics of everything run inside the with-statement """
+    metrics = Metrics()
+    metrics.start()
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
@@ -0,0 +1,167 @@
+"""
+Data race detection on the shared values (MyInt, MyString, MyBool: .v) and the thread-unsafe MyFifo and
+MyBag of a DUT, with vector clocks.
+
+Happens-before comes from the synchronisation objects: signalling a semaphore, unlocking a mutex (also by a
+condition variable wait), notifying a condition variable and arriving at a barrier release the clock of the
+thread to the object; getting through a wait acquires it. Two accesses to the same object race when at
+least one of them writes and neither happens before the other. Every race is reported once per pair of
+access sites (file:line).
+
+The clocks are kept small, so detection can stay on with many threads (FastTrack, Flanagan & Freund):
+- a vector clock is a dict {thread: clock} of its non-zero entries
+- per object, only the last write is kept as an epoch (thread, clock); reads as one epoch as long as they
+  are ordered, as a clock per reading thread only while they are concurrent
+
+record: with Races.detecting() as races:
+            env.run_headless(...)
+        print(races.report())
+
+usage: python Races.py <dut> [seed] [max_steps]
+"""
+import collections
+import contextlib
+import sys
+
+import Environment as env
+
+Race = collections.namedtuple("Race", "name first first_thread first_line second second_thread second_line")
+
+
+class RaceDetector(object):
+    """ vector-clock race detector of a simulation, see the module docstring """
+
+    def __init__(self):
+        self.context = env.current_context()    # the simulation it checks, see start()
+        self.races = []         # Race per pair of access sites
+        self._seen = set()      # (object index, {the two lines}) of the races found, in either order
+        self._scheduler = None
+        self._new_run()
+
+    def start(self, context=None):
+        if context is not None:
+            self.context = context
+        self.context.races = self
+
+    def stop(self):
+        if self.context.races is self:
+            self.context.races = None
+
+    def _new_run(self):
+        # every run starts with fresh threads and objects
+        self._scheduler = self.context.scheduler
+        self._clocks = {}       # thread -> its vector clock
+        self._sync = {}         # (object, key) -> vector clock released to it
+        self._writes = {}       # object -> (thread, clock, line, operation) of the last write
+        self._reads = {}        # object -> (thread, clock, line, operation) or {thread: (clock, line, operation)}
+        self._index = {}        # id(object) -> its index in subscribed_objects, the same in every run
+
+    def _thread(self):
+        # the index of the calling DUT thread and its clock; (None, None) for other threads (e.g. setup())
+        if self.context.scheduler is not self._scheduler:
+            self._new_run()
+        t = self.context.scheduler.thread_index()
+        if t is None:
+            return None, None
+        clock = self._clocks.get(t)
+        if clock is None:
+            clock = self._clocks[t] = {t: 1}
+        return t, clock
+
+    # called by the synchronisation objects, under scheduler.lock
+
+    def release(self, obj, key=None):
+        t, clock = self._thread()
+        if t is None:
+            return
+        released = self._sync.setdefault((obj, key), {})
+        for u, c in clock.items():
+            if c > released.get(u, 0):
+                released[u] = c
+        clock[t] += 1
+
+    def acquire(self, obj, key=None):
+        t, clock = self._thread()
+        released = self._sync.get((obj, key))
+        if t is None or released is None:
+            return
+        for u, c in released.items():
+            if c > clock.get(u, 0):
+                clock[u] = c
+
+    # called by the shared objects
+
+    def access(self, obj, write, op):
+        with self.context.scheduler.lock:
+            t, clock = self._thread()
+            if t is None:
+                return
+            line = sys._getframe(2).f_lineno     # the DUT line that did the access
+            now = clock[t]
+            last = self._writes.get(obj)
+            if last is not None and last[0] != t and last[1] > clock.get(last[0], 0):
+                self._race(obj, last, (t, now, line, op))
+            reads = self._reads.get(obj)
+            if write:
+                if last is not None and last[0] == t and last[1] == now:
+                    return      # same epoch
+                if type(reads) is tuple:
+                    reads = {reads[0]: reads[1:]}
+                for u, (c, read_line, read_op) in (reads or {}).items():
+                    if u != t and c > clock.get(u, 0):
+                        self._race(obj, (u, c, read_line, read_op), (t, now, line, op))
+                self._writes[obj] = (t, now, line, op)
+                self._reads.pop(obj, None)
+            elif reads is None or (type(reads) is tuple and (reads[0] == t or reads[1] <= clock.get(reads[0], 0))):
+                # no reads, or ordered after the last one: a single epoch will do
+                self._reads[obj] = (t, now, line, op)
+            else:
+                if type(reads) is tuple:
+                    reads = self._reads[obj] = {reads[0]: reads[1:]}
+                reads[t] = (now, line, op)
+
+    def _race(self, obj, first, second):
+        # by index, not by name: objects may share a name (e.g. made in a loop)
+        index = self._index.get(id(obj))
+        if index is None:
+            self._index = {id(o): i for i, o in enumerate(self.context.subscribed_objects)}
+            index = self._index.get(id(obj), id(obj))
+        key = (index, frozenset((first[2], second[2])))
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        name = '{} {}'.format(type(obj).__name__, obj._name)
+        self.races.append(Race(name, first[3], first[0], first[2], second[3], second[0], second[2]))
+
+    # results
+
+    def report(self):
+        dut = self.context.dut_file
+        if not self.races:
+            return 'no races found'
+        lines = ['{} race(s) found:'.format(len(self.races))]
+        for race in self.races:
+            lines.append('  {}: {} by thread {} at {}:{} and {} by thread {} at {}:{} are not ordered'.format(
+                race.name, race.first, race.first_thread, dut, race.first_line, race.second, race.second_thread,
+                dut, race.second_line))
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def detecting():
+    """ look for races in everything run inside the with-statement """
+    detector = RaceDetector()
+    detector.start()
+    try:
+        yield detector
+    finally:
+        detector.stop()
+
+
+if __name__ == '__main__':
+    with detecting() as races:
+        env.load_dut(sys.argv[1])
+        print(env.run_headless(env.RandomPolicy(int(sys.argv[2]) if len(sys.argv) > 2 else None),
+                               int(sys.argv[3]) if len(sys.argv) > 3 else 100000, quiet=True))
+    print(races.report())
+    sys.exit(1 if races.races else 0)
@@ -0,0 +1,214 @@
+"""
+Replay of a recorded schedule (the thread picked at every _blk() decision) with seeking.
+
+The DUT is run once, headless, under a ReplayPolicy; after every step the changed objects and thread
+positions are kept as a delta, and every 'every' steps a full checkpoint is kept. Seeking to a step
+starts at the nearest checkpoint before it and re-applies the deltas from there, so it costs at most
+'every' deltas, whatever the length of the run.
+Note: the DUT threads are real threads, their stacks can't be restored; a replay can be inspected at
+any step, a live run continues from the end of the schedule only.
+
+A schedule is saved as JSON: {"dut": ..., "overrides": {...}, "schedule": [...]}
+
+usage: python Replay.py <schedule.json>
+       python Replay.py <dut> <seed> [max_steps]     (records a random run first)
+"""
+import json
+import pathlib
+import sys
+import tkinter as tk
+
+import Environment as env
+
+
+def save_schedule(path, dut, schedule, **overrides):
+    """ save a schedule (e.g. HeadlessResult.schedule) to replay it later """
+    with open(path, "w") as f:
+        json.dump({"dut": dut, "overrides": overrides, "schedule": list(schedule)}, f)
+
+
+def load_schedule(path):
+    """ returns (dut, schedule, overrides) """
+    with open(path) as f:
+        saved = json.load(f)
+    return saved["dut"], saved["schedule"], saved.get("overrides", {})
+
+
+class ReplayState(object):
+    """ the state after a number of steps """
+
+    def __init__(self, step, objects, threads, next_thread):
+        self.step = step
+        self.objects = objects          # rendering (str()) per subscribed object
+        self.threads = threads          # (line, status) per thread
+        self.next_thread = next_thread  # the thread that makes the next step (None: end of the replay)
+
+
+class _RecordingPolicy(object):
+    """ replays the schedule and lets the Replay capture the state before every decision """
+
+    def __init__(self, replay, schedule):
+        self.replay = replay
+        self.policy = env.ReplayPolicy(schedule)
+
+    def choose(self, runnable, current):
+        self.replay.capture()
+        return self.policy.choose(runnable, current)
+
+
+class Replay(object):
+    """ a DUT run under a recorded schedule that can be inspected at every step, see the module docstring """
+
+    def __init__(self, dut, schedule, every=1000, **overrides):
+        self.dut = dut
+        self.schedule = schedule
+        self.every = every
+        self.checkpoints = []   # per 'every' steps: (objects, threads)
+        self.deltas = []        # per step: (changed objects [(index, text)], changed threads [(index, state)])
+        self._versions = []
+        self._objects = []
+        self._threads = []
+        module = env.load_dut(dut, **overrides)
+        self.file = module.__file__
+        self.result = env.run_headless(_RecordingPolicy(self, schedule), max_steps=len(schedule), quiet=True)
+        self.capture()          # the state after the last step
+
+    def __len__(self):
+        # number of states: one more than the number of steps
+        return len(self.deltas)
+
+    def capture(self):
+        sched = env.scheduler
+        if len(self.deltas) > sched.steps:
+            return
+        objects = []
+        for i, obj in enumerate(env.subscribed_objects):
+            if i == len(self._versions):
+                self._versions.append(None)
+                self._objects.append(None)
+            if obj._version != self._versions[i]:
+                self._versions[i] = obj._version
+                self._objects[i] = str(obj).rstrip("\n")
+                objects.append((i, self._objects[i]))
+        threads = []
+        for t in range(env.threads_nrof):
+            if t in sched.finished:
+                state = (None, "finished")
+            elif t in sched.blocked:
+                state = (sched.positions.get(t), "waits for " + sched.blocked[t]._name)
+            elif t in sched.sleeping:
+                state = (sched.positions.get(t), "sleeps until {:.3f}s".format(sched.sleeping[t]))
+            else:
+                state = (sched.positions.get(t), "runnable")
+            if t == len(self._threads):
+                self._threads.append(None)
+            if state != self._threads[t]:
+                self._threads[t] = state
+                threads.append((t, state))
+        if len(self.deltas) % self.every == 0:
+            self.checkpoints.append((tuple(self._objects), tuple(self._threads)))
+        self.deltas.append((objects, threads))
+
+    def seek(self, step):
+        """ the ReplayState after 'step' steps """
+        step = max(0, min(step, len(self.deltas) - 1))
+        checkpoint = step // self.every
+        objects, threads = (list(s) for s in self.checkpoints[checkpoint])
+        for changed_objects, changed_threads in self.deltas[checkpoint * self.every + 1:step + 1]:
+            for i, text in changed_objects:
+                if i == len(objects):
+                    objects.append(text)
+                else:
+                    objects[i] = text
+            for t, state in changed_threads:
+                threads[t] = state
+        next_thread = self.schedule[step] if step < len(self.schedule) else None
+        return ReplayState(step, objects, threads, next_thread)
+
+
+class ReplayGui(object):
+    """ source, objects and thread positions of a Replay, with a slider to seek to any step """
+
+    colors = ("#ffd0d0", "#d0ffd0", "#d0d0ff", "#ffffb0", "#ffd0ff", "#d0ffff")
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.root = tk.Tk()
+        self.root.title("Sync Simulator - replay {} ({}, {} steps)".format(replay.dut, replay.result.status,
+                                                                          len(replay) - 1))
+        self.root.rowconfigure(0, minsize=600, weight=1)
+        self.root.columnconfigure(0, minsize=500, weight=1)
+        self.root.columnconfigure(1, minsize=500, weight=1)
+
+        self.txt_source = tk.Text(self.root)
+        self.txt_variables = tk.Text(self.root)
+        self.frm_control = tk.Frame(self.root, relief=tk.RAISED, bd=1)
+        self.lbl_threads = tk.Label(self.root, justify=tk.LEFT, anchor="w", font="TkFixedFont")
+
+        self.step = tk.IntVar()
+        sld_step = tk.Scale(self.frm_control, variable=self.step, from_=0, to=len(replay) - 1,
+                            orient=tk.HORIZONTAL, command=lambda _: self.show(self.step.get()))
+        buttons = (("|<", lambda: self.show(0)),
+                   ("<", lambda: self.show(self.step.get() - 1)),
+                   (">", lambda: self.show(self.step.get() + 1)),
+                   (">|", lambda: self.show(len(self.replay) - 1)),
+                   ("Quit", self.root.quit))
+        for column, (text, command) in enumerate(buttons):
+            tk.Button(self.frm_control, text=text, command=command).grid(row=0, column=column, padx=5, pady=5)
+        sld_step.grid(row=0, column=len(buttons), sticky="ew")
+        self.frm_control.columnconfigure(len(buttons), weight=1)
+
+        self.txt_source.grid(row=0, column=0, sticky="nsew")
+        self.txt_variables.grid(row=0, column=1, sticky="nsew")
+        self.lbl_threads.grid(row=1, column=0, columnspan=2, sticky="ew")
+        self.frm_control.grid(row=2, column=0, columnspan=2, sticky="ew")
+
+        with open(replay.file) as f:
+            for line_nbr, line in enumerate(f, 1):
+                self.txt_source.insert(tk.END, '{:2}: {}'.format(line_nbr, line))
+        for t in range(env.threads_nrof):
+            self.txt_source.tag_configure("thread{}".format(t), background=self.colors[t % len(self.colors)])
+        self.rendered = []
+        self.show(0)
+
+    def show(self, step):
+        state = self.replay.seek(step)
+        self.step.set(state.step)
+        if len(self.rendered) != len(state.objects):
+            self.txt_variables.delete(1.0, tk.END)
+            self.txt_variables.insert(tk.END, "\n".join(state.objects))
+        else:
+            for line_nbr, (old, new) in enumerate(zip(self.rendered, state.objects), 1):
+                if old != new:
+                    self.txt_variables.replace('{}.0'.format(line_nbr), '{}.end'.format(line_nbr), new)
+        self.rendered = state.objects
+        lines = ['step {}/{}, next: thread {}'.format(state.step, len(self.replay) - 1,
+                                                      "-" if state.next_thread is None else state.next_thread)]
+        for t, (line_nbr, status) in enumerate(state.threads):
+            tag = "thread{}".format(t)
+            self.txt_source.tag_remove(tag, 1.0, tk.END)
+            if line_nbr is not None:
+                self.txt_source.tag_add(tag, '{}.0'.format(line_nbr), '{}.end'.format(line_nbr))
+            lines.append('thread {}: line {:>4} {}'.format(t, "-" if line_nbr is None else line_nbr, status))
+        self.lbl_threads["text"] = "\n".join(lines)
+        if state.next_thread is not None and state.threads[state.next_thread][0] is not None:
+            self.txt_source.see('{}.0'.format(state.threads[state.next_thread][0]))
+
+    def mainloop(self):
+        self.root.mainloop()
+
+
+def replay_gui(dut, schedule, every=1000, **overrides):
+    """ record a replay of the schedule and show it """
+    ReplayGui(Replay(dut, schedule, every, **overrides)).mainloop()
+
+
+if __name__ == '__main__':
+    if pathlib.Path(sys.argv[1]).suffix == ".json":
+        dut, schedule, overrides = load_schedule(sys.argv[1])
+    else:
+        dut, overrides = sys.argv[1], {}
+        env.load_dut(dut)
+        schedule = env.run_headless(env.RandomPolicy(int(sys.argv[2])),
+                                    int(sys.argv[3]) if len(sys.argv) > 3 else 100000, quiet=True).schedule
+    replay_gui(dut, schedule, **overrides)
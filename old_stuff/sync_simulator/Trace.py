@@ -0,0 +1,212 @@
+"""
+Compact binary execution trace of a simulator run.
+
+Every operation on a DUT object is written as one fixed-size record:
+    thread index, source line, object index, operation, value before, value after, timestamp (monotonic ns)
+The records are packed into a preallocated ring buffer; a full buffer is spilled to a memory-mapped file in
+one copy, so recording can stay on during long (fuzzing) runs. Next to the trace, <trace>.json holds the
+object kinds/names, the operation names and the strings that non-integer values were interned as.
+
+record: with Trace.recording("run.trace"):
+            env.run_headless(...)
+read:   for event in Trace.TraceReader("run.trace"):
+            ...
+
+usage: python Trace.py <trace> [number of events to print]
+"""
+import collections
+import contextlib
+import json
+import mmap
+import struct
+import sys
+import time
+
+import Environment as env
+
+MAGIC = b"SYNCTRC1"
+HEADER = struct.Struct("<8sQ")              # magic, number of records
+RECORD = struct.Struct("<HHHBxqqQ")         # thread, line, object, operation, before, after, timestamp
+NONE = 0xFFFF                               # thread/object index when unknown (e.g. the main thread)
+STRINGS = 0x80                              # operation flag: before/after are indices in the string table
+
+OPERATIONS = ("wait", "signal", "lock", "unlock", "notify", "notify_all", "write", "put", "get")
+_OPERATION_CODES = {name: code for code, name in enumerate(OPERATIONS)}
+
+TraceEvent = collections.namedtuple("TraceEvent", "thread line obj op before after ns")
+
+
+class TraceRecorder(object):
+    """ records the operations on DUT objects to a binary trace file, see the module docstring """
+
+    def __init__(self, path, capacity=1 << 16):
+        self.path = path
+        self.context = env.current_context()    # the simulation it records, see start()
+        self.count = 0                  # records in the file
+        self.objects = []               # [kind, name] per object index
+        self.strings = []
+        self._string_index = {}
+        self._object_index = {}
+        self._ring = bytearray(capacity * RECORD.size)
+        self._view = memoryview(self._ring)
+        self._capacity = capacity
+        self._used = 0                  # records in the ring buffer
+        self._file = open(path, "w+b")
+        self._file.truncate(HEADER.size + len(self._ring))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._offset = HEADER.size
+        HEADER.pack_into(self._map, 0, MAGIC, 0)
+
+    def start(self, context=None):
+        if context is not None:
+            self.context = context
+        self.context.trace_hook = self.record
+
+    def stop(self):
+        if self.context.trace_hook == self.record:
+            self.context.trace_hook = None
+
+    def record(self, obj, op, before, after):
+        ns = time.monotonic_ns()
+        context = obj._ctx
+        thread = context.scheduler.thread_index()
+        if thread is None:
+            thread = NONE
+        frame = sys._getframe(2)        # the DUT line that called the operation
+        if frame.f_code.co_filename == env.__file__:
+            # an operation done by another one (e.g. the mutex of a lightswitch): the last DUT line of the thread
+            line = context.scheduler.positions.get(thread, 0)
+        else:
+            line = frame.f_lineno
+        index = self._object_index.get(id(obj))
+        if index is None:
+            index = self._add_object(obj)
+        code = _OPERATION_CODES[op]
+        # gui threads really run concurrently, headless ones take turns (and the lock is a no-op there)
+        with context.scheduler.lock:
+            offset = self._used * RECORD.size
+            try:
+                RECORD.pack_into(self._ring, offset, thread, line, index, code, before, after, ns)
+            except struct.error:
+                # not a (64 bit) integer: intern it
+                RECORD.pack_into(self._ring, offset, thread, line, index, code | STRINGS,
+                                 self._intern(before), self._intern(after), ns)
+            self._used += 1
+            if self._used == self._capacity:
+                self._spill()
+
+    def _add_object(self, obj):
+        self._object_index = {id(o): i for i, o in enumerate(obj._ctx.subscribed_objects)}
+        self.objects = [[type(o).__name__, o._name] for o in obj._ctx.subscribed_objects]
+        return self._object_index.get(id(obj), NONE)
+
+    def _intern(self, value):
+        text = str(value)
+        index = self._string_index.get(text)
+        if index is None:
+            index = self._string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def _spill(self):
+        size = self._used * RECORD.size
+        end = self._offset + size
+        if end > len(self._map):
+            self._map.resize(max(end, 2 * len(self._map)))
+        self._map[self._offset:end] = self._view[:size]
+        self._offset = end
+        self.count += self._used
+        self._used = 0
+        # keep the header valid, a crashed run only loses the ring buffer
+        HEADER.pack_into(self._map, 0, MAGIC, self.count)
+
+    def close(self):
+        self.stop()
+        with self.context.scheduler.lock:
+            if self._map.closed:
+                return
+            self._spill()
+            self._map.flush()
+            self._map.close()
+            self._file.truncate(self._offset)
+            self._file.close()
+        with open(self.path + ".json", "w") as f:
+            json.dump({"operations": OPERATIONS, "objects": self.objects, "strings": self.strings}, f)
+
+
+@contextlib.contextmanager
+def recording(path, capacity=1 << 16):
+    """ record a binary trace of everything run inside the with-statement """
+    recorder = TraceRecorder(path, capacity)
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.close()
+
+
+class TraceReader(object):
+    """ memory-mapped, random-access view of a trace written by TraceRecorder """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("'{}' is not a simulator trace".format(path))
+        self.count = min(count, (len(self._map) - HEADER.size) // RECORD.size)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            # a run that did not close its trace
+            meta = {"operations": OPERATIONS, "objects": [], "strings": []}
+        self.operations = meta["operations"]
+        self.objects = meta["objects"]
+        self.strings = meta["strings"]
+
+    def __len__(self):
+        return self.count
+
+    def records(self):
+        """ the undecoded record tuples, the fastest way to scan a large trace """
+        data = memoryview(self._map)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        return RECORD.iter_unpack(data)
+
+    def decode(self, record):
+        thread, line, obj, code, before, after, ns = record
+        if code & STRINGS:
+            before, after = self.strings[before], self.strings[after]
+        return TraceEvent(None if thread == NONE else thread, line, None if obj == NONE else obj,
+                          self.operations[code & ~STRINGS], before, after, ns)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("trace index out of range")
+        return self.decode(RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size))
+
+    def __iter__(self):
+        return map(self.decode, self.records())
+
+    def object_name(self, index):
+        return "?" if index is None or index >= len(self.objects) else self.objects[index][1]
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == '__main__':
+    reader = TraceReader(sys.argv[1])
+    shown = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    counts = collections.Counter()
+    for thread, line, obj, code, before, after, ns in reader.records():
+        counts[obj, code & ~STRINGS] += 1
+    print('{}: {} events'.format(sys.argv[1], len(reader)))
+    for (obj, code), n in sorted(counts.items()):
+        print('  {:20} {:10}: {}'.format(reader.object_name(obj), reader.operations[code], n))
+    for event in (reader[i] for i in range(min(shown, len(reader)))):
+        print('  {:>14} t{} line {:3} {:20} {:10} {} -> {}'.format(event.ns, event.thread, event.line,
+                                                                   reader.object_name(event.obj), event.op,
+                                                                   event.before, event.after))
@@ -0,0 +1,104 @@
+"""
+Run DUTs headless for a number of seeds and step budgets, in parallel over all cores, and summarize.
+
+usage: python batch.py [-h] [--seeds SEED ...] [--steps STEPS ...] [--set NAME=value ...] [--jobs N] [--json]
+                       [--virtual-time] [--backend {threads,greenlets}] DUT [DUT ...]
+A DUT is a module name, a .py file or a directory (all Dut*.py in it), e.g.
+       python batch.py . --seeds 1-20 --steps 10000 100000
+The exit status is 1 when a run deadlocked or raised an exception.
+"""
+import argparse
+import concurrent.futures
+import json
+import pathlib
+import sys
+
+import Environment as env
+
+
+def run_one(dut_dir, dut, seed, max_steps, overrides, virtual_time=False, backend="threads"):
+    """ one headless run, in a worker process; returns its summary as a dict """
+    if dut_dir not in sys.path:
+        sys.path.insert(0, dut_dir)
+    summary = {"dut": dut, "seed": seed, "max_steps": max_steps, "status": "error", "steps": 0,
+               "seconds": 0.0, "steps_per_second": 0.0, "virtual_seconds": 0.0, "detail": None}
+    env.current_context().virtual_time = virtual_time
+    env.current_context().backend = backend
+    try:
+        env.load_dut(dut, **overrides)
+        result = env.run_headless(env.RandomPolicy(seed), max_steps, quiet=True)
+    except Exception as e:
+        summary["detail"] = "loading failed: {!r}".format(e)
+        return summary
+    summary.update(status=result.status, steps=result.steps, seconds=result.seconds,
+                   steps_per_second=result.steps_per_second(), virtual_seconds=result.virtual_seconds)
+    if result.exception is not None:
+        summary["detail"] = 'thread {}: {!r}'.format(*result.exception)
+    elif result.deadlock is not None:
+        summary["detail"] = result.deadlock
+    return summary
+
+
+def find_duts(names):
+    """ (directory, module name) per DUT argument """
+    duts = []
+    for name in names:
+        path = pathlib.Path(name)
+        if path.is_dir():
+            duts.extend((str(path.resolve()), p.stem) for p in sorted(path.glob("Dut*.py")))
+        elif path.suffix == ".py":
+            duts.append((str(path.resolve().parent), path.stem))
+        else:
+            duts.append((str(pathlib.Path.cwd()), name))
+    return duts
+
+
+def parse_seeds(values):
+    seeds = []
+    for value in values:
+        first, _, last = value.partition("-")
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+
+def table(summaries):
+    lines = ['{:32} {:>6} {:>9} {:9} {:>9} {:>9}  {}'.format("dut", "seed", "budget", "status", "steps",
+                                                            "steps/s", "detail")]
+    for s in summaries:
+        detail = (s["detail"] or "").splitlines()
+        lines.append('{:32} {:6} {:9} {:9} {:9} {:9.0f}  {}'.format(s["dut"], s["seed"], s["max_steps"], s["status"],
+                                                                   s["steps"], s["steps_per_second"],
+                                                                   detail[0] if detail else ""))
+    counts = {}
+    for s in summaries:
+        counts[s["status"]] = counts.get(s["status"], 0) + 1
+    lines.append('{} runs: {}'.format(len(summaries), ", ".join('{} {}'.format(n, status)
+                                                                for status, n in sorted(counts.items()))))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run DUTs headless over seeds and step budgets")
+    parser.add_argument("duts", nargs="+", metavar="DUT", help="module name, .py file or directory of Dut*.py")
+    parser.add_argument("--seeds", nargs="+", default=["1"], help="seeds and ranges of seeds, e.g. 1 5 10-20")
+    parser.add_argument("--steps", nargs="+", type=int, default=[100000], help="step budgets")
+    parser.add_argument("--set", nargs="+", default=[], metavar="NAME=value", help="DUT module globals, e.g. N=1")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--virtual-time", action="store_true", help="time.sleep() of the DUTs on a virtual clock")
+    parser.add_argument("--backend", choices=sorted(env.BACKENDS), default="threads",
+                        help="run the DUT threads as OS threads or as greenlets (for thousands of them)")
+    args = parser.parse_args(argv)
+
+    overrides = env.parse_overrides(args.set)
+    runs = [(dut_dir, dut, seed, steps, overrides, args.virtual_time, args.backend)
+            for dut_dir, dut in find_duts(args.duts) for seed in parse_seeds(args.seeds) for steps in args.steps]
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as pool:
+        summaries = list(pool.map(run_one, *zip(*runs))) if runs else []
+
+    print(json.dumps(summaries, indent=1) if args.json else table(summaries))
+    return 1 if any(s["status"] in ("deadlock", "exception", "error") for s in summaries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import pathlib
 import Environment as env
-import importlib
+import Metrics
+import Races
+import Replay
+import Trace
 import sys
 
 # 'dut_dir': directory where you store your LBoS source files
@@ -15,11 +18,73 @@ dut_dir = ""
 #myDut = "Dut42_ReaderWriter_CondVar"
 myDut = "Dut_Example"
 
+# 'headless': run 'myDut' without gui under the token-passing scheduler; the same 'seed' always
+# gives the same interleaving
+headless = False
+seed = 42
+max_steps = 100000
+# 'backend': what the DUT threads of a headless run are: "threads" or "greenlets" (needs the greenlet package;
+# for thousands of DUT threads)
+backend = "threads"
+
+# 'trace_file': if not empty, every operation on a DUT object is recorded to this binary trace
+# (read it with: python Trace.py <trace_file>)
+trace_file = ""
+
+# 'metrics_file': if not empty, wait/hold times per object are shown in the gui and exported to this
+# .json or .csv file at the end
+metrics_file = ""
+
+# 'virtual_time': time.sleep() in 'myDut' advances a virtual clock instead of taking wall time; steps take no
+# virtual time, so when all threads sleep, wait or are stopped at a breakpoint, the clock jumps to the first
+# thread that is due
+virtual_time = False
+
+# 'detect_races': report the unsynchronised accesses to shared values, FIFOs and bags at the end
+detect_races = False
+
+# 'replay_file': if not empty, a schedule saved with Replay.save_schedule() is replayed step by step
+replay_file = ""
+
 if __name__ == '__main__':
     sys.path.append(dut_dir)
+    env.current_context().virtual_time = virtual_time
+    env.current_context().backend = backend
+
+    if replay_file:
+        dut, schedule, overrides = Replay.load_schedule(replay_file)
+        Replay.replay_gui(dut, schedule, **overrides)
+        sys.exit()
+
+    recorder = Trace.TraceRecorder(trace_file) if trace_file else None
+    if recorder:
+        recorder.start()
+    metrics = Metrics.Metrics() if metrics_file else None
+    if metrics:
+        metrics.start()
+    races = Races.RaceDetector() if detect_races else None
+    if races:
+        races.start()
+
+    if headless:
+        env.load_dut(myDut)
+        print(env.run_headless(env.RandomPolicy(seed), max_steps))
+        if recorder:
+            recorder.close()
+        if metrics:
+            print(metrics.report())
+            metrics.export(metrics_file)
+        if races:
+            print(races.report())
+        sys.exit()
 
-    dut = importlib.import_module(myDut)
-    dut.setup()
+    env.load_dut(myDut)
     env.GuiCreate(pathlib.Path(dut_dir, myDut + ".py"))
 
     env.GuiMainloop()
+    if recorder:
+        recorder.close()
+    if metrics:
+        metrics.export(metrics_file)
+    if races:
+        print(races.report())